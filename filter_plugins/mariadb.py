@@ -15,6 +15,12 @@ from ansible.module_utils.common._collections_compat import Mapping
 
 display = Display()
 
+# log files of [mysqld], which can't be shared by server instances
+INSTANCE_FILES = [
+    "log_error", "log_bin", "log_bin_index", "relay_log", "relay_log_index",
+    "slow_query_log_file", "general_log_file",
+]
+
 
 class FilterModule(object):
     """
@@ -27,6 +33,8 @@ class FilterModule(object):
             'detect_galera': self.detect_galera,
             'wsrep_cluster_address': self.wsrep_cluster_address,
             'system_user': self.system_user,
+            'server_instances': self.server_instances,
+            'autotune': self.autotune,
         }
 
     def support_tls(self, data):
@@ -206,3 +214,173 @@ class FilterModule(object):
         display.vv(f"= {result}")
 
         return result
+
+    def server_instances(self, data, run_directory="/run/mysqld", base_port=3307, mysqld=None):
+        """
+            every instance gets its own datadir, socket, pid file, port and server_id.
+            the log files of the [mysqld] options in 'mysqld' get the instance name as suffix,
+            wsrep is disabled (the instances are no galera cluster nodes).
+
+            input: [
+                {'name': 'shard1', 'cpu_affinity': '0-7', 'numa_node': 0,
+                 'config': {'innodb_buffer_pool_size': '8G'}}
+            ]
+
+            output: [
+                {
+                  'name': 'shard1',
+                  'service': 'mariadb@shard1',
+                  'group': 'mysqld.shard1',
+                  'mysqld': {'datadir': '/var/lib/mysql-shard1', 'socket': '/run/mysqld/mysqld-shard1.sock',
+                             'pid_file': '/run/mysqld/mysqld-shard1.pid', 'port': 3307,
+                             'server_id': 101, 'log_error': '/var/log/mysql/error-shard1.log',
+                             'log_bin': 'db-log-bin-shard1', 'log_bin_index': 'db-log-bin-shard1.index',
+                             'wsrep_on': 'OFF', 'innodb_buffer_pool_size': '8G'},
+                  'systemd': {'cpu_affinity': '0-7', 'numa_policy': 'bind', 'numa_mask': '0'}
+                }
+            ]
+        """
+        display.vv(f"server_instances({data}, {run_directory}, {base_port}, {mysqld})")
+        result = []
+
+        mysqld_files = {
+            k.replace("-", "_"): v for k, v in (mysqld or {}).items()
+            if k.replace("-", "_") in INSTANCE_FILES and isinstance(v, str) and v.lower() not in ["", "on", "off", "1", "0"]
+        }
+
+        try:
+            server_id = int((mysqld or {}).get("server_id", 1))
+        except (TypeError, ValueError):
+            server_id = 1
+
+        for index, instance in enumerate(data or []):
+            name = instance.get("name")
+
+            mysqld = dict(
+                datadir=instance.get("datadir", f"/var/lib/mysql-{name}"),
+                socket=f"{run_directory}/mysqld-{name}.sock",
+                pid_file=f"{run_directory}/mysqld-{name}.pid",
+                port=instance.get("port", int(base_port) + index),
+                server_id=server_id * 100 + index + 1,
+                wsrep_on="OFF",
+            )
+            mysqld.update({k: self._instance_file(v, name) for k, v in mysqld_files.items()})
+            mysqld.update(instance.get("config", {}) or {})
+
+            cpu_affinity = instance.get("cpu_affinity")
+            numa_node = instance.get("numa_node")
+
+            if isinstance(cpu_affinity, list):
+                cpu_affinity = " ".join([str(x) for x in cpu_affinity])
+
+            if isinstance(numa_node, list):
+                numa_node = ",".join([str(x) for x in numa_node])
+
+            systemd = dict(
+                cpu_affinity=cpu_affinity,
+                numa_policy=instance.get("numa_policy", "bind" if numa_node is not None else None),
+                numa_mask=None if numa_node is None else str(numa_node),
+            )
+
+            result.append(dict(
+                name=name,
+                service=f"mariadb@{name}",
+                group=f"mysqld.{name}",
+                mysqld=mysqld,
+                systemd=systemd,
+            ))
+
+        display.vv(f"= {result}")
+
+        return result
+
+    def _instance_file(self, value, name):
+        """
+            '/var/log/mysql/error.log' -> '/var/log/mysql/error-shard1.log'
+            'db-log-bin'               -> 'db-log-bin-shard1'
+        """
+        root, ext = os.path.splitext(value)
+
+        if ext not in [".log", ".index", ".err"]:
+            root, ext = value, ""
+
+        return f"{root}-{name}{ext}"
+
+    def autotune(self, facts, datadir="/var/lib/mysql", instances=1):
+        """
+            throughput settings for [mysqld] from the gathered facts:
+              - memtotal_mb      : buffer pool, redo log and connections
+              - processor_vcpus  : thread pool
+              - processor_count  : NUMA interleaving on multi socket hosts
+              - mounts / devices : io capacity for rotational or solid state disks
+
+            the memory is shared by 'instances' servers on this host.
+            all values can be overwritten in mariadb_config_mysqld.
+        """
+        display.vv(f"autotune(facts, {datadir}, {instances})")
+
+        chunk_mb = 128
+        instances = max(1, int(instances))
+
+        memtotal_mb = int(facts.get("memtotal_mb", 1024)) // instances
+        vcpus = int(facts.get("processor_vcpus") or facts.get("processor_cores") or 1)
+        sockets = int(facts.get("processor_count") or 1)
+
+        # dedicated database hosts: most of the memory for the buffer pool
+        if memtotal_mb >= 8192:
+            ratio = 0.7
+        elif memtotal_mb >= 2048:
+            ratio = 0.5
+        else:
+            ratio = 0.25
+
+        # multiple of innodb_buffer_pool_chunk_size
+        buffer_pool_mb = max(chunk_mb, int(memtotal_mb * ratio) // chunk_mb * chunk_mb)
+
+        # 25% of the buffer pool, between 64M and 4G
+        log_file_mb = min(4096, max(64, buffer_pool_mb // 4))
+
+        # about 12M per connection in the memory outside of the buffer pool
+        max_connections = min(4096, max(100, (memtotal_mb - buffer_pool_mb) // 12))
+
+        rotational = self._datadir_rotational(facts, datadir)
+        io_capacity = 200 if rotational else 2000
+
+        result = dict(
+            innodb_buffer_pool_size=f"{buffer_pool_mb}M",
+            # ignored since 10.5
+            loose_innodb_buffer_pool_instances=min(8, max(1, buffer_pool_mb // 1024)),
+            innodb_log_file_size=f"{log_file_mb}M",
+            innodb_io_capacity=io_capacity,
+            innodb_io_capacity_max=io_capacity * 2,
+            thread_pool_size=vcpus // instances if vcpus >= instances else 1,
+            max_connections=max_connections,
+        )
+
+        if sockets > 1 and instances == 1:
+            result["loose_innodb_numa_interleave"] = 1
+
+        display.vv(f"= {result}")
+
+        return result
+
+    def _datadir_rotational(self, facts, datadir):
+        """
+            rotational flag of the disk below the data directory,
+            False for unknown devices (LVM, network storage, containers)
+        """
+        mounts = [x for x in facts.get("mounts", []) if datadir == x.get("mount") or datadir.startswith(x.get("mount", "").rstrip("/") + "/")]
+
+        if not mounts:
+            return False
+
+        device = os.path.basename(sorted(mounts, key=lambda x: len(x.get("mount")))[-1].get("device", ""))
+        devices = facts.get("devices", {})
+
+        for name, values in devices.items():
+            partitions = values.get("partitions", {}) or {}
+
+            if device == name or device in partitions:
+                return str(values.get("rotational", "0")) == "1"
+
+        return False
@@ -8,8 +8,17 @@ from __future__ import absolute_import, print_function
 import os
 import grp
 import pwd
+import re
+import json
+import shlex
+import time
+import shutil
+import hashlib
+import tarfile
 
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mariadb_copy import TreeCopy
+from ansible.module_utils.mariadb_file import ensure_ownership, write_file_atomic
 
 __metaclass__ = type
 
@@ -19,6 +28,21 @@ ANSIBLE_METADATA = {
     'supported_by': 'community'
 }
 
+# server options which change the files of a new data directory,
+# a template is only used for the same values
+LAYOUT_OPTIONS = [
+    "aria_block_size",
+    "innodb_checksum_algorithm",
+    "innodb_data_file_path",
+    "innodb_default_row_format",
+    "innodb_file_per_table",
+    "innodb_log_file_size",
+    "innodb_log_files_in_group",
+    "innodb_page_size",
+    "innodb_undo_tablespaces",
+    "lower_case_table_names",
+]
+
 
 class MariadbBootstrap(object):
     """
@@ -36,11 +60,20 @@ class MariadbBootstrap(object):
         self.mariadb_user = module.params.get("user")
         self.mariadb_force = module.params.get("force")
         self.mariadb_no_defaults = module.params.get("no_defaults")
+        self.defaults_group_suffix = module.params.get("defaults_group_suffix")
         self.mariadb_skip_auth_anonymous_user = module.params.get("skip_auth_anonymous_user")
         self.mariadb_skip_name_resolve = module.params.get("skip_name_resolve")
         self.mariadb_skip_test_db = module.params.get("skip_test_db")
+        self.template = module.params.get("template")
+        self.template_directory = module.params.get("template_directory")
+        self.socket = module.params.get("socket")
+        self.pid_file = module.params.get("pid_file")
+
+        # first file of innodb_data_file_path, read from the server options in run()
+        self.innodb_data_file = os.path.join(self.mariadb_datadir, "ibdata1")
 
-        self.bootstrapped_file = "/etc/.mariadb.bootstrapped"
+        # one marker per data directory, multiple instances don't share the state
+        self.marker_file = os.path.join(self.mariadb_datadir, ".mariadb.bootstrapped")
 
     def get_file_ownership(self, filename):
         return (
@@ -48,45 +81,86 @@ class MariadbBootstrap(object):
             grp.getgrgid(os.stat(filename).st_gid).gr_name
         )
 
-    def touch(self, fname):
+    def bootstrap_state(self):
+        """
+          a data directory is initialized if the privilege table (Aria since 10.4,
+          MyISAM before), the InnoDB system tablespace (innodb_data_file_path below
+          innodb_data_home_dir) and the Aria control file exist
+        """
+        system_tables = [
+            os.path.join("mysql", "global_priv.MAI"),
+            os.path.join("mysql", "user.MAI"),
+            os.path.join("mysql", "user.MYD"),
+            os.path.join("mysql", "user.frm"),
+        ]
+
+        state = dict(
+            system_tables=any(os.path.exists(os.path.join(self.mariadb_datadir, x)) for x in system_tables),
+            innodb=os.path.exists(self.innodb_data_file),
+            aria=os.path.exists(os.path.join(self.mariadb_datadir, "aria_log_control")),
+        )
+
+        state["bootstrapped"] = all(state.values())
+
+        return state
+
+    def load_marker(self):
+        """
+        """
         try:
-            os.utime(fname, None)
-        except OSError:
-            open(fname, 'a').close()
+            with open(self.marker_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
 
-    def run(self):
-        result = dict(
-            failed=False,
-            msg="none"
+    def save_marker(self, state, complete=True):
+        """
+          complete=False before the data directory is initialized,
+          a marker which stays incomplete is an interrupted bootstrap.
+          returns an error message, a missing marker must not be ignored
+        """
+        marker = dict(
+            datadir=self.mariadb_datadir,
+            bootstrapped=int(time.time()),
+            complete=complete,
+            state=state,
         )
 
-        # change into basedir (needful at archlinux)
-        os.chdir("/usr")
+        try:
+            if not os.path.isdir(self.mariadb_datadir):
+                os.makedirs(self.mariadb_datadir, 0o0755)
 
-        mariadb_install_db = self.module.get_bin_path('mysql_install_db', True)
+            write_file_atomic(self.marker_file, json.dumps(marker, indent=2, sort_keys=True), mode=0o0644)
+        except OSError as e:
+            return f"can't write {self.marker_file}: {e}"
 
-        # no binary found
-        if not mariadb_install_db:
-            return dict(
-                failed=True,
-                msg="can't find 'mysql_install_db' on system. please install package first."
-            )
+        return None
+
+    def server_running(self):
+        """
+          the socket or the pid file of the server exists
+        """
+        return any(os.path.exists(x) for x in [self.socket, self.pid_file] if x)
 
-        user_table_exists = os.path.exists(os.path.join(self.mariadb_datadir, "mysql", "user.frm"))
-        bootstrap_file_exists = os.path.exists(self.bootstrapped_file)
+    def clean_datadir(self):
+        """
+          remove the files of an interrupted bootstrap
+        """
+        for entry in os.listdir(self.mariadb_datadir):
+            path = os.path.join(self.mariadb_datadir, entry)
 
-        # self.module.log(msg="= user.MYD             : {}".format(os.path.join(self.mariadb_datadir, "mysql", "user.frm")))
-        # self.module.log(msg="= user_table_exists    : {}".format(user_table_exists))
-        # self.module.log(msg="= bootstrap_file_exists: {}".format(bootstrap_file_exists))
+            if entry in [".mariadb.bootstrapped", "lost+found"]:
+                continue
 
-        # bootstrapped_file found
-        if user_table_exists and bootstrap_file_exists:
-            return dict(
-                failed=False,
-                changed=False,
-                msg="mariadb is already bootstrapped"
-            )
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
 
+    def install_args(self):
+        """
+          the mysql_install_db options without the data directory
+        """
         args = []
 
         if self.mariadb_no_defaults:
@@ -94,6 +168,11 @@ class MariadbBootstrap(object):
             # Must be given as the first option.
             args.append("--no-defaults")
 
+        elif self.defaults_group_suffix:
+            # Also read the option groups with this suffix, e.g. [mysqld.instance]
+            # of a 'mariadb@instance' service.
+            args.append(f"--defaults-group-suffix={self.defaults_group_suffix}")
+
         # The login user name to use for running mysqld.
         args.append("--user")
         args.append(self.mariadb_user)
@@ -103,10 +182,6 @@ class MariadbBootstrap(object):
         #     args.append("--basedir")
         #     args.append(self.mariadb_basedir)
 
-        # The path to the MariaDB data directory.
-        args.append("--datadir")
-        args.append(self.mariadb_datadir)
-
         args.append("--auth-root-authentication-method=socket")
 
         if self.mariadb_skip_auth_anonymous_user:
@@ -123,18 +198,332 @@ class MariadbBootstrap(object):
             # Don't install the test database.
             args.append("--skip-test-db")
 
+        return args
+
+    def install_db(self, mariadb_install_db, datadir):
+        """
+        """
+        args = self.install_args()
+
+        # The path to the MariaDB data directory.
+        args.append("--datadir")
+        args.append(datadir)
+
         # self.module.log(msg="  args: {}".format(args))
 
-        rc, out, err = self.module.run_command(
+        return self.module.run_command(
             [mariadb_install_db] + args,
             check_rc=False)
 
+    def bootstrap_from_template(self, mariadb_install_db):
+        """
+          clone a pre-initialized data directory instead of running mysql_install_db
+        """
+        ignored = [".mariadb.bootstrapped", "lost+found"]
+
+        if os.path.isdir(self.mariadb_datadir) and [x for x in os.listdir(self.mariadb_datadir) if x not in ignored]:
+            self.module.log(msg=f"WARNING: {self.mariadb_datadir} is not empty, the template is not used")
+            return None
+
+        template = self.template
+
+        if template and not os.path.exists(template):
+            return dict(
+                failed=True,
+                msg=f"template {template} does not exist."
+            )
+
+        if not template:
+            template, error = self.template_path()
+
+            if error:
+                return dict(
+                    failed=True,
+                    msg=error
+                )
+
+            # the template for this version and these options is created only once
+            if not os.path.isdir(template):
+                tmp_template = f"{template}.tmp"
+
+                if os.path.isdir(tmp_template):
+                    shutil.rmtree(tmp_template)
+
+                os.makedirs(tmp_template, 0o0755)
+                shutil.chown(tmp_template, self.mariadb_user)
+
+                rc, out, err = self.install_db(mariadb_install_db, tmp_template)
+
+                if rc != 0:
+                    return dict(
+                        failed=True,
+                        msg=out
+                    )
+
+                os.rename(tmp_template, template)
+
+        user = pwd.getpwnam(self.mariadb_user)
+
+        if not os.path.isdir(self.mariadb_datadir):
+            os.makedirs(self.mariadb_datadir, 0o0755)
+
+        try:
+            if os.path.isdir(template):
+                TreeCopy(template, self.mariadb_datadir, uid=user.pw_uid, gid=user.pw_gid).run()
+            else:
+                with tarfile.open(template) as archive:
+                    if hasattr(tarfile, "data_filter"):
+                        archive.extractall(self.mariadb_datadir, filter="data")
+                    else:
+                        archive.extractall(self.mariadb_datadir)
+
+                self.fix_ownership(self.mariadb_datadir, user.pw_uid, user.pw_gid)
+
+        except (OSError, tarfile.TarError) as e:
+            return dict(
+                failed=True,
+                msg=f"can't clone template {template}: {e}"
+            )
+
+        state = self.bootstrap_state()
+
+        if not state.get("bootstrapped"):
+            return dict(
+                failed=True,
+                state=state,
+                msg=f"template {template} is not an initialized data directory."
+            )
+
+        error = self.save_marker(state)
+
+        if error:
+            return dict(
+                failed=True,
+                state=state,
+                msg=error
+            )
+
+        return dict(
+            failed=False,
+            changed=True,
+            template=template,
+            msg=f"The MariaDB data directory was cloned from {template}."
+        )
+
+    def template_path(self):
+        """
+          <template_directory>/<server version>-<checksum of the install options and the data directory layout>
+        """
+        server_binary = self.module.get_bin_path("mariadbd", False) or self.module.get_bin_path("mysqld", False)
+
+        if not server_binary:
+            return (None, "can't find the mariadb server binary.")
+
+        rc, out, err = self.module.run_command([server_binary, "--version"], check_rc=False)
+
+        match = re.search(r"Ver\s+(?P<version>\d+\.\d+\.\d+)", out)
+
+        if rc != 0 or not match:
+            return (None, f"can't detect the server version: {err}")
+
+        layout, error = self.server_layout(server_binary)
+
+        if error:
+            return (None, error)
+
+        key = self.install_args() + [f"{k}={v}" for k, v in sorted(layout.items())]
+        checksum = hashlib.sha256(" ".join(key).encode("utf-8")).hexdigest()[:8]
+
+        return (os.path.join(self.template_directory, f"{match.group('version')}-{checksum}"), None)
+
+    def server_layout(self, server_binary):
+        """
+          the effective LAYOUT_OPTIONS of the server configuration
+          returns ({'innodb_page_size': '16k', ...}, error)
+        """
+        options, error = self.server_options(server_binary)
+
+        if error:
+            return (None, error)
+
+        return ({k: v.lower() for k, v in options.items() if k in LAYOUT_OPTIONS}, None)
+
+    def innodb_system_tablespace(self):
+        """
+          the first file of innodb_data_file_path (default 'ibdata1') below innodb_data_home_dir (default datadir)
+        """
+        options = {}
+        server_binary = self.module.get_bin_path("mariadbd", False) or self.module.get_bin_path("mysqld", False)
+
+        if server_binary:
+            options, error = self.server_options(server_binary)
+
+            if error:
+                self.module.log(msg=f"WARNING: {error}")
+                options = {}
+
+        data_file = options.get("innodb_data_file_path") or "ibdata1:12M:autoextend"
+        home_dir = options.get("innodb_data_home_dir") or self.mariadb_datadir
+
+        # 'ibdata1:12M;ibdata2:50M:autoextend' -> 'ibdata1'
+        return os.path.join(self.mariadb_datadir, home_dir, data_file.split(";")[0].split(":")[0])
+
+    def server_options(self, server_binary):
+        """
+          the effective server options (mariadbd --print-defaults)
+          returns ({'innodb_page_size': '16K', ...}, error)
+        """
+        args = [server_binary]
+        args += [x for x in self.install_args() if x.startswith(("--no-defaults", "--defaults-group-suffix"))]
+        args.append("--print-defaults")
+
+        rc, out, err = self.module.run_command(args, check_rc=False)
+
+        if rc != 0:
+            return (None, f"can't read the server options: {err}")
+
+        options = {}
+
+        # the first line is 'mariadbd would have been started with the following arguments:'
+        for option in shlex.split(" ".join(out.splitlines()[1:])):
+            if not option.startswith("--"):
+                continue
+
+            name, _, value = option[2:].partition("=")
+            name = name.replace("-", "_")
+
+            if name.startswith("loose_"):
+                name = name[len("loose_"):]
+
+            # the last value wins, like for the server
+            options[name] = value
+
+        return (options, None)
+
+    def fix_ownership(self, path, uid, gid):
+        """
+        """
+        ensure_ownership(path, uid=uid, gid=gid)
+
+        for root, dirs, files in os.walk(path):
+            for item in dirs + files:
+                ensure_ownership(os.path.join(root, item), uid=uid, gid=gid)
+
+    def run(self):
+        result = dict(
+            failed=False,
+            msg="none"
+        )
+
+        # change into basedir (needful at archlinux)
+        os.chdir("/usr")
+
+        mariadb_install_db = self.module.get_bin_path('mysql_install_db', True)
+
+        # no binary found
+        if not mariadb_install_db:
+            return dict(
+                failed=True,
+                msg="can't find 'mysql_install_db' on system. please install package first."
+            )
+
+        self.innodb_data_file = self.innodb_system_tablespace()
+
+        state = self.bootstrap_state()
+        marker = self.load_marker()
+
+        self.module.log(msg=f"= bootstrap state: {state}, marker: {marker}")
+
+        if marker and not marker.get("complete", True):
+            # only the files of an interrupted bootstrap are removed, never a data directory in use
+            if state.get("bootstrapped") or self.server_running():
+                return dict(
+                    failed=True,
+                    state=state,
+                    msg=f"the bootstrap of {self.mariadb_datadir} is not complete ({self.marker_file}), but the data directory "
+                        "is initialized or the server is running. Check the data directory and remove the marker."
+                )
+
+            self.module.log(msg=f"WARNING: the bootstrap of {self.mariadb_datadir} was interrupted, the data directory is initialized again")
+
+            try:
+                self.clean_datadir()
+            except OSError as e:
+                return dict(
+                    failed=True,
+                    msg=f"can't clean the data directory {self.mariadb_datadir}: {e}"
+                )
+
+            state = self.bootstrap_state()
+            marker = None
+
+        if state.get("bootstrapped"):
+            # datadirs of older versions only have the global bootstrap file
+            error = None if marker else self.save_marker(state)
+
+            if error:
+                return dict(
+                    failed=True,
+                    state=state,
+                    msg=error
+                )
+
+            return dict(
+                failed=False,
+                changed=False,
+                state=state,
+                msg="mariadb is already bootstrapped"
+            )
+
+        if marker:
+            # never initialize a bootstrapped data directory with missing files again
+            return dict(
+                failed=True,
+                state=state,
+                msg=f"{self.mariadb_datadir} was bootstrapped ({self.marker_file}), but the data directory is incomplete. "
+                    "Restore the data directory or remove it together with the marker."
+            )
+
+        partial = any(state.get(x) for x in ["system_tables", "innodb", "aria"])
+
+        if partial and not self.mariadb_force:
+            return dict(
+                failed=True,
+                state=state,
+                msg=f"{self.mariadb_datadir} is partially initialized, but not by this module. "
+                    "Remove the data directory or use 'force' to run mysql_install_db on it."
+            )
+
+        error = self.save_marker(state, complete=False)
+
+        if error:
+            return dict(
+                failed=True,
+                state=state,
+                msg=error
+            )
+
+        if self.template or self.template_directory:
+            result = self.bootstrap_from_template(mariadb_install_db)
+
+            # None: the data directory isn't empty, use mysql_install_db
+            if result:
+                return result
+
+        rc, out, err = self.install_db(mariadb_install_db, self.mariadb_datadir)
+
         # self.module.log(msg="  rc : '{}'".format(rc))
         # self.module.log(msg="  out: '{}' ({})".format(out, type(out)))
         # self.module.log(msg="  err: '{}'".format(err))
 
         if rc == 0:
-            self.touch(self.bootstrapped_file)
+            error = self.save_marker(self.bootstrap_state())
+
+            if error:
+                return dict(
+                    failed=True,
+                    msg=error
+                )
 
             return dict(
                 failed=False,
@@ -177,6 +566,10 @@ def main():
             required=False,
             type='bool'
         ),
+        defaults_group_suffix=dict(
+            required=False,
+            type='str'
+        ),
         skip_auth_anonymous_user=dict(
             required=False,
             type='bool'
@@ -189,6 +582,22 @@ def main():
             required=False,
             type='bool'
         ),
+        template=dict(
+            required=False,
+            type='path'
+        ),
+        template_directory=dict(
+            required=False,
+            type='path'
+        ),
+        socket=dict(
+            required=False,
+            type='path'
+        ),
+        pid_file=dict(
+            required=False,
+            type='path'
+        ),
     )
 
     module = AnsibleModule(
@@ -0,0 +1,149 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_capabilities import MariadbCapabilities
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_capabilities.py
+author:
+    - 'Bodo Schulz'
+short_description: probe the capabilities of a running mariadb server.
+description:
+    - Returns version, replica term, GTID, galera and TLS support of the running server as facts.
+    - The result is cached in I(cache_directory) and only probed again after a server restart
+      or a change of the server binary.
+options:
+  cache_directory:
+    description:
+      - Directory in which the probed server capabilities are cached.
+    type: path
+    required: false
+"""
+
+EXAMPLES = """
+- name: detect running mariadb server
+  mariadb_capabilities:
+    login_unix_socket: "{{ mariadb_socket }}"
+    config_file: /root/.my.cnf
+    cache_directory: "{{ mariadb_config_dir }}"
+  register: _mariadb_capabilities
+"""
+
+RETURN = """
+ansible_facts:
+  description: the server capabilities as C(mariadb_capabilities)
+  returned: success
+  type: dict
+  sample:
+    mariadb_capabilities:
+      version: 10.11.6
+      short_version: "10.11"
+      full_version: 10.11.6-MariaDB-0+deb12u1
+      version_comment: Debian 12
+      replica_term: REPLICA
+      gtid: true
+      galera: false
+      tls: false
+"""
+
+# ---------------------------------------------------------------------------------------
+
+
+class MariadbServerCapabilities(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.config_file = module.params.get("config_file")
+        self.cache_directory = module.params.get("cache_directory")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
+
+    def run(self):
+        """
+        """
+        helper = MariadbCapabilities(
+            self.module,
+            cache_directory=self.cache_directory,
+            socket=self.login_unix_socket
+        )
+
+        # a valid cache entry avoids the database connection at all
+        capabilities = helper.load(helper.fingerprint())
+
+        if not capabilities:
+            cursor, conn, error, message = mariadb_connect(
+                self.module,
+                login_user=self.login_username,
+                login_password=self.login_password,
+                login_unix_socket=self.login_unix_socket,
+                config_file=self.config_file,
+                use_broker=self.use_broker,
+                broker_ttl=self.broker_ttl
+            )
+
+            if error:
+                return dict(
+                    failed=True,
+                    msg=message
+                )
+
+            capabilities = helper.probe(cursor)
+            conn.close()
+
+        return dict(
+            changed=False,
+            ansible_facts=dict(
+                mariadb_capabilities=capabilities
+            )
+        )
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        cache_directory=dict(
+            required=False,
+            type='path'
+        ),
+    )
+    specs.update(broker_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbServerCapabilities(module)
+    result = client.run()
+
+    module.log(msg=f"= result: {result}")
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
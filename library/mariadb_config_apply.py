@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import os
+import re
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec, server_stopped
+from ansible.module_utils.mariadb_config import (
+    SERVER_GROUPS, MASKED_VALUE, read_option_file, server_variables, config_diff, normalize_value, values_equal, sql_value, redact)
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_config_apply.py
+author:
+    - 'Bodo Schulz'
+short_description: apply a changed option file to the running mariadb server without restart.
+description:
+    - Compares the server options of an option file (e.g. the rendered C(mysql.cnf)) with the
+      global variables of the running server.
+    - Changed dynamic variables are set with C(SET GLOBAL), a restart is only required
+      if a static (read only) variable changed.
+    - The static variables are read from C(information_schema.SYSTEM_VARIABLES), on older servers
+      C(SHOW GLOBAL VARIABLES) is used and a read only variable is detected by the failed C(SET GLOBAL).
+    - Paths are compared without trailing slash, relative file names (e.g. C(log_bin_index)) below the C(datadir).
+      Sizes rounded by the server (e.g. C(innodb_buffer_pool_size) to the chunk size) are not set again.
+    - Options which are no system variables (e.g. C(user)) are ignored.
+    - Variables the server shows masked (e.g. C(wsrep_sst_auth)) are not compared and not set,
+      values of credentials are never returned.
+    - Options removed from the file are not reset, the server keeps the current value until the next restart.
+    - A stopped server (nothing listens on I(login_unix_socket)) returns C(restart_required),
+      every other connection error fails.
+options:
+  option_file:
+    description:
+      - The option file with the desired server configuration.
+    type: path
+    required: true
+  groups:
+    description:
+      - The option groups of the file read by the server.
+    type: list
+    elements: str
+    default: [server, mysqld, mariadb, galera]
+  ignore:
+    description:
+      - Variables which are never set at runtime, a change of them requires a restart.
+    type: list
+    elements: str
+    required: false
+  pid_file:
+    description:
+      - Pid file of the server. A server with a running process isn't treated as stopped.
+    type: path
+    required: false
+"""
+
+EXAMPLES = """
+- name: apply dynamic configuration changes
+  mariadb_config_apply:
+    option_file: "{{ mariadb_config_include_dir }}/mysql.cnf"
+    login_unix_socket: "{{ mariadb_socket }}"
+    config_file: /root/.my.cnf
+  register: _mariadb_config_apply
+
+- name: restart mariadb
+  ansible.builtin.service:
+    name: mariadb
+    state: restarted
+  when:
+    - _mariadb_config_apply.restart_required
+"""
+
+RETURN = """
+applied:
+  description: the variables changed with SET GLOBAL
+  returned: always
+  type: list
+  sample:
+    - name: innodb_buffer_pool_size
+      before: "134217728"
+      after: "8589934592"
+static:
+  description: changed read only variables, which force the restart
+  returned: always
+  type: list
+  sample:
+    - name: innodb_log_file_size
+      current: "100663296"
+      desired: "512M"
+restart_required:
+  description: a static variable changed
+  returned: always
+  type: bool
+unknown:
+  description: options of the file which are no system variables of the server
+  returned: success
+  type: list
+  sample:
+    - user
+"""
+
+# ---------------------------------------------------------------------------------------
+
+# dynamic variables, which would break the cluster membership when changed at runtime
+RESTART_VARIABLES = [
+    "wsrep_on",
+    "wsrep_provider",
+    "wsrep_provider_options",
+    "wsrep_cluster_address",
+    "wsrep_cluster_name",
+    "wsrep_node_address",
+]
+
+VALID_NAME = re.compile(r"^[a-z0-9_]+$")
+
+# ER_INCORRECT_GLOBAL_LOCAL_VAR: 'Variable '%s' is a read only variable'
+ER_READ_ONLY_VARIABLE = 1238
+
+
+class MariadbConfigApply(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.option_file = module.params.get("option_file")
+        self.groups = module.params.get("groups")
+        self.ignore = module.params.get("ignore") or []
+        self.pid_file = module.params.get("pid_file")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
+
+    def run(self):
+        """
+        """
+        if not os.path.isfile(self.option_file):
+            return dict(
+                failed=True,
+                restart_required=False,
+                msg=f"option file {self.option_file} does not exist."
+            )
+
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
+
+        if error:
+            if server_stopped(self.login_unix_socket, self.pid_file):
+                # a stopped server reads the option file at the next start
+                return dict(
+                    changed=False,
+                    restart_required=True,
+                    applied=[],
+                    static=[],
+                    msg=f"server not running, the configuration is used at the next start. ({message})"
+                )
+
+            # e.g. wrong credentials, a restart would not help
+            return dict(
+                failed=True,
+                restart_required=False,
+                applied=[],
+                static=[],
+                msg=message
+            )
+
+        try:
+            variables = server_variables(cursor)
+            diff, unknown = config_diff(read_option_file(self.option_file, self.groups), variables)
+
+            applied = []
+            static = [x for x in diff if x.get("read_only") is True or x.get("name") in RESTART_VARIABLES + self.ignore]
+            dynamic = [x for x in diff if x not in static]
+
+            for entry in dynamic:
+                if self.module.check_mode:
+                    applied.append(dict(name=entry.get("name"), before=entry.get("current"), after=redact(entry.get("name"), entry.get("desired"))))
+                    continue
+
+                after, read_only = self.set_global(cursor, entry)
+
+                if read_only:
+                    static.append(entry)
+                else:
+                    applied.append(dict(name=entry.get("name"), before=entry.get("current"), after=after))
+
+        except Exception as e:
+            return dict(
+                failed=True,
+                restart_required=False,
+                applied=[],
+                static=[],
+                msg=f"can't apply the configuration: {to_native(e)}"
+            )
+
+        finally:
+            conn.close()
+
+        static = [
+            dict(name=x.get("name"), current=x.get("current"), desired=redact(x.get("name"), x.get("desired")))
+            for x in static
+        ]
+
+        if static:
+            msg = f"restart required for: {', '.join([x.get('name') for x in static])}"
+        elif applied:
+            msg = f"{len(applied)} variable(s) changed at runtime."
+        else:
+            msg = "the running server uses the configuration."
+
+        return dict(
+            changed=len(applied) > 0,
+            restart_required=len(static) > 0,
+            applied=applied,
+            static=static,
+            unknown=unknown,
+            msg=msg
+        )
+
+    def set_global(self, cursor, entry):
+        """
+          returns (new value, read only)
+        """
+        name = entry.get("name")
+
+        if not VALID_NAME.match(name):
+            raise ValueError(f"invalid variable name '{name}'")
+
+        try:
+            cursor.execute(f"SET GLOBAL {name} = %s", (sql_value(entry.get("desired")),))
+        except Exception as e:
+            if entry.get("read_only") is None and e.args and e.args[0] == ER_READ_ONLY_VARIABLE:
+                return (None, True)
+            raise Exception(f"SET GLOBAL {name}: {to_native(e)}")
+
+        cursor.execute(f"SELECT @@GLOBAL.{name}")
+        after = cursor.fetchone()[0]
+
+        if MASKED_VALUE.match(str(after or "")):
+            return (str(after), False)
+
+        if not values_equal(entry.get("desired"), after):
+            # e.g. innodb_buffer_pool_size is rounded to a multiple of the chunk size
+            self.module.log(msg=f"WARNING: {name} was set to {after} instead of {redact(name, normalize_value(entry.get('desired')))}")
+
+        return (redact(name, str(after)), False)
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        option_file=dict(
+            required=True,
+            type='path'
+        ),
+        groups=dict(
+            required=False,
+            type='list',
+            elements='str',
+            default=SERVER_GROUPS
+        ),
+        ignore=dict(
+            required=False,
+            type='list',
+            elements='str'
+        ),
+        pid_file=dict(
+            required=False,
+            type='path'
+        ),
+    )
+    specs.update(broker_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbConfigApply(module)
+    result = client.run()
+
+    module.log(msg=f"= result: {result}")
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import os
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
+from ansible.module_utils.mariadb_config import SERVER_GROUPS, read_option_file, server_variables, config_diff, redact
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_config_drift.py
+author:
+    - 'Bodo Schulz'
+short_description: compare the running mariadb server with the rendered option file.
+description:
+    - Reads the server option groups of an option file (e.g. the rendered C(mysql.cnf)) and compares
+      them with the global variables of the running server, read with a single query.
+    - Option names and values are normalized (C(-) and C(_), C(loose-) prefix, C(skip-) options,
+      sizes like C(16M), C(ON) / C(1)).
+    - Paths are compared without trailing slash, relative file names (e.g. C(log_bin_index)) below the C(datadir).
+      Sizes rounded by the server (e.g. C(innodb_buffer_pool_size) to the chunk size) are no drift.
+    - Variables the server shows masked (e.g. C(wsrep_sst_auth)) can't be compared and are skipped,
+      values of credentials are never returned.
+    - The module never changes anything and can be used in check mode.
+options:
+  option_file:
+    description:
+      - The option file with the desired server configuration.
+    type: path
+    required: true
+  groups:
+    description:
+      - The option groups of the file read by the server.
+    type: list
+    elements: str
+    default: [server, mysqld, mariadb, galera]
+  ignore:
+    description:
+      - Variables which are not compared.
+    type: list
+    elements: str
+    required: false
+  fail_on_drift:
+    description:
+      - Fail if the running server differs from the option file.
+    type: bool
+    default: false
+"""
+
+EXAMPLES = """
+- name: compare running server with the configuration
+  mariadb_config_drift:
+    option_file: "{{ mariadb_config_include_dir }}/mysql.cnf"
+    login_unix_socket: "{{ mariadb_socket }}"
+    config_file: /root/.my.cnf
+  check_mode: true
+  register: _mariadb_config_drift
+"""
+
+RETURN = """
+in_sync:
+  description: the running server uses the configuration of the option file
+  returned: success
+  type: bool
+drift:
+  description: all variables with a different value
+  returned: success
+  type: list
+  sample:
+    - name: max_connections
+      option: max-connections
+      configured: "500"
+      running: "151"
+      restart_required: false
+unknown:
+  description: options of the file which are no system variables of the server
+  returned: success
+  type: list
+  sample:
+    - user
+"""
+
+# ---------------------------------------------------------------------------------------
+
+
+class MariadbConfigDrift(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.option_file = module.params.get("option_file")
+        self.groups = module.params.get("groups")
+        self.ignore = module.params.get("ignore") or []
+        self.fail_on_drift = module.params.get("fail_on_drift")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
+
+    def run(self):
+        """
+        """
+        if not os.path.isfile(self.option_file):
+            return dict(
+                failed=True,
+                msg=f"option file {self.option_file} does not exist."
+            )
+
+        try:
+            options = read_option_file(self.option_file, self.groups)
+        except (OSError, UnicodeDecodeError) as e:
+            return dict(
+                failed=True,
+                msg=f"can't read {self.option_file}: {to_native(e)}"
+            )
+
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
+
+        if error:
+            return dict(
+                failed=True,
+                msg=message
+            )
+
+        try:
+            variables = server_variables(cursor)
+        except Exception as e:
+            return dict(
+                failed=True,
+                msg=f"can't read the server variables: {to_native(e)}"
+            )
+        finally:
+            conn.close()
+
+        diff, unknown = config_diff(options, variables)
+
+        drift = [
+            dict(
+                name=x.get("name"),
+                option=x.get("option"),
+                configured=redact(x.get("name"), x.get("desired")),
+                running=x.get("current"),
+                # None: unknown on servers without information_schema.SYSTEM_VARIABLES
+                restart_required=x.get("read_only"),
+            )
+            for x in diff if x.get("name") not in self.ignore
+        ]
+
+        if drift:
+            msg = f"{len(drift)} variable(s) differ from {self.option_file}: {', '.join([x.get('name') for x in drift])}"
+        else:
+            msg = f"the running server uses the configuration of {self.option_file}."
+
+        return dict(
+            changed=False,
+            failed=self.fail_on_drift and len(drift) > 0,
+            in_sync=len(drift) == 0,
+            drift=drift,
+            unknown=unknown,
+            msg=msg
+        )
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        option_file=dict(
+            required=True,
+            type='path'
+        ),
+        groups=dict(
+            required=False,
+            type='list',
+            elements='str',
+            default=SERVER_GROUPS
+        ),
+        ignore=dict(
+            required=False,
+            type='list',
+            elements='str'
+        ),
+        fail_on_drift=dict(
+            required=False,
+            type='bool',
+            default=False
+        ),
+    )
+    specs.update(broker_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbConfigDrift(module)
+    result = client.run()
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
@@ -5,13 +5,19 @@
 # Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
 
 from __future__ import absolute_import, print_function
-import shutil
 import os
 import grp
 import pwd
+import json
+import stat
+import shlex
+import socket
+import fnmatch
 
 # from ansible.module_utils import distro
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mariadb_copy import CopyManifest, TreeCopy, copy_file, reflink_supported, same_filesystem, scan_tree
+from ansible.module_utils.mariadb_file import ensure_ownership, write_file_atomic
 
 __metaclass__ = type
 
@@ -21,6 +27,157 @@ ANSIBLE_METADATA = {
     'supported_by': 'community'
 }
 
+# rewritten by 'mariabackup --prepare', always taken from the stopped server
+SYSTEM_FILES = [
+    "ibdata*",
+    "ib_logfile*",
+    "undo[0-9]*",
+    "aria_log*",
+    "ib_buffer_pool",
+    "ddl_recovery*.log",
+]
+
+DOCUMENTATION = """
+---
+module: mariadb_data_directory.py
+author:
+    - 'Bodo Schulz'
+short_description: move the mariadb data directory.
+description:
+    - On the same filesystem I(source) is renamed to I(destination).
+    - Otherwise I(source) is cloned (reflink) or copied to I(destination) and renamed to C(<source>.dist).
+    - The tree is scanned once, files are copied by a thread pool (largest first) with
+      reflink, C(copy_file_range) or C(sendfile), the ownership of I(source) is set while copying.
+    - The progress (bytes, files, ETA) is written to I(status_file).
+options:
+  method:
+    description:
+      - C(auto) uses C(rename) if source and destination are on the same filesystem (C(st_dev)),
+        C(reflink) if the filesystems supports cloning (FICLONE) and C(copy) otherwise.
+    type: str
+    default: auto
+    choices: [auto, rename, reflink, copy]
+  keep_source:
+    description:
+      - Never rename, keep the original data as C(<source>.dist).
+    type: bool
+    default: false
+  threads:
+    description:
+      - Number of parallel copy workers.
+    type: int
+    default: 4
+  status_file:
+    description:
+      - JSON file with the copy progress. Default is C(<destination>.progress.json).
+    type: path
+  manifest_file:
+    description:
+      - JSON file with size and mtime of every copied file. Default is C(<destination>.manifest.json).
+      - An interrupted copy is resumed with the files which are missing in the manifest
+        or have been changed since.
+    type: path
+  state:
+    description:
+      - C(moved) copies or renames the stopped data directory.
+      - C(prepared) streams a C(mariabackup --backup --stream=mbstream) of the running server into
+        I(destination) and prepares it. Size and mtime of all source files are recorded before the backup.
+      - C(finalized) needs the stopped server. Files which changed since the backup and the
+        redo log / system tablespace files are copied again, files which no longer exist in
+        I(source) are removed, then I(source) is renamed to C(<source>.dist).
+    type: str
+    default: moved
+    choices: [moved, prepared, finalized]
+  pid_file:
+    description:
+      - Pid file of the server. C(finalized) fails while this process is running.
+      - C(finalized) also fails if the I(login_unix_socket) accepts connections or a
+        C(mariadbd) / C(mysqld) process runs in I(source).
+    type: path
+  login_user:
+    description:
+      - User for mariabackup. The password is read from I(config_file).
+    type: str
+  login_unix_socket:
+    description:
+      - Socket of the running server for mariabackup.
+    type: str
+  config_file:
+    description:
+      - Client configuration with the credentials for mariabackup.
+    type: path
+    default: /root/.my.cnf
+  verify_checksum:
+    description:
+      - Compare the sha256 checksums of source and destination (in parallel) before the source
+        is renamed. Size and modification time are always compared.
+    type: bool
+    default: false
+"""
+
+EXAMPLES = """
+- name: move data directory
+  mariadb_data_directory:
+    source: /var/lib/mysql
+    destination: /srv/mysql
+    threads: 8
+
+# online migration, the server is only stopped for the final sync
+
+- name: copy the running server with mariabackup
+  mariadb_data_directory:
+    source: /var/lib/mysql
+    destination: /srv/mysql
+    state: prepared
+    login_user: root
+    login_unix_socket: /run/mysqld/mysqld.sock
+    config_file: /root/.my.cnf
+
+- name: stop mariadb
+  ansible.builtin.service:
+    name: mariadb
+    state: stopped
+
+- name: final delta sync
+  mariadb_data_directory:
+    source: /var/lib/mysql
+    destination: /srv/mysql
+    state: finalized
+    pid_file: /run/mysqld/mysqld.pid
+
+- name: use the new data directory
+  ansible.builtin.template:
+    src: etc/mysql/conf.d/mysql.cnf.j2
+    dest: /etc/mysql/conf.d/mysql.cnf
+    mode: "0644"
+
+- name: start mariadb
+  ansible.builtin.service:
+    name: mariadb
+    state: started
+"""
+
+RETURN = """
+method:
+  description: the used method (rename, reflink or copy)
+  returned: success
+  type: str
+progress:
+  description: the final copy progress
+  returned: if the data was copied
+  type: dict
+  sample:
+    state: done
+    files_total: 212
+    files_copied: 212
+    files_reflinked: 0
+    bytes_total: 1073741824
+    bytes_copied: 1073741824
+    bytes_per_second: 524288000
+    elapsed_seconds: 2
+    eta_seconds: 0
+"""
+
 
 class MariadbDataDirectories(object):
     """
@@ -35,6 +192,27 @@ class MariadbDataDirectories(object):
         self.module = module
         self.source = module.params.get("source")
         self.destination = module.params.get("destination")
+        self.threads = module.params.get("threads")
+        self.method = module.params.get("method")
+        self.keep_source = module.params.get("keep_source")
+        self.status_file = module.params.get("status_file")
+
+        self.verify_checksum = module.params.get("verify_checksum")
+        self.manifest_file = module.params.get("manifest_file")
+
+        if not self.status_file:
+            self.status_file = "{}.progress.json".format(self.destination.rstrip("/"))
+
+        if not self.manifest_file:
+            self.manifest_file = "{}.manifest.json".format(self.destination.rstrip("/"))
+
+        self.state = module.params.get("state")
+        self.pid_file = module.params.get("pid_file")
+        self.login_user = module.params.get("login_user")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.config_file = module.params.get("config_file")
+
+        self.snapshot_file = "{}.snapshot.json".format(self.destination.rstrip("/"))
 
     def get_file_ownership(self, filename):
         return (
@@ -51,46 +229,377 @@ class MariadbDataDirectories(object):
                     self.source, self.destination)
             )
 
-        if os.path.exists(self.destination):
+        if self.state == "prepared":
+            return self.backup_prepare()
+
+        if self.state == "finalized":
+            return self.backup_finalize()
+
+        manifest = CopyManifest(self.manifest_file, self.source)
+
+        # an interrupted copy is resumed, a finished one is left alone
+        started = os.path.isdir(self.source) and os.path.exists(self.destination)
+        resume = started and manifest.load() and manifest.state not in ["complete"]
+
+        if os.path.exists(self.destination) and not resume:
             return dict(
                 failed=False,
                 changed=False,
                 msg="directory {} already exists".format(self.destination)
             )
 
-        # info = Path(self.source)
-        # owner = info.owner()
-        # group = info.group()
+        source_stat = os.stat(self.source)
 
         owner, group = self.get_file_ownership(self.source)
 
         self.module.log(msg="  owner: {} | group: {}".format(owner, group))
 
         try:
-            shutil.copytree(self.source, self.destination)
+            # like shutil.copytree, the parent of the destination may not exist yet
+            os.makedirs(os.path.dirname(self.destination.rstrip("/")), exist_ok=True)
+
+            method = "copy" if resume else self.detect_method()
+
+            self.module.log(msg="  method: {}".format(method))
+
+            if method == "rename":
+                os.rename(self.source, self.destination)
 
-            for root, dirs, files in os.walk(self.destination):
-                shutil.chown(root, owner, group)
-                for item in dirs:
-                    shutil.chown(os.path.join(root, item), owner, group)
-                for item in files:
-                    shutil.chown(os.path.join(root, item), owner, group)
+                return dict(
+                    changed=True,
+                    failed=False,
+                    method=method,
+                    msg="directory {} renamed to {}".format(self.source, self.destination)
+                )
+
+            # ownership is set while copying, no second walk over the tree
+            tree = TreeCopy(
+                self.source,
+                self.destination,
+                uid=source_stat.st_uid,
+                gid=source_stat.st_gid,
+                threads=self.threads,
+                use_reflink=(method == "reflink"),
+                status_file=self.status_file,
+                manifest_file=self.manifest_file
+            )
+
+            progress = tree.run()
+
+            differences = tree.verify(checksum=self.verify_checksum)
+
+            if differences:
+                return dict(
+                    changed=False,
+                    failed=True,
+                    method=method,
+                    progress=progress,
+                    differences=differences[:20],
+                    msg="verification of {} failed for {} file(s), {} was not renamed".format(
+                        self.destination, len(differences), self.source)
+                )
 
             os.rename(self.source, "{}.dist".format(self.source))
 
-        # Directories are the same
-        except shutil.Error as e:
-            self.module.log(msg="  Directory not copied. Error: {}".format(e))
-        # Any error saying that the directory doesn't exist
+            tree.manifest.save("complete")
+
         except OSError as e:
             self.module.log(msg="  Directory not copied. Error: {}".format(e))
 
+            return dict(
+                changed=False,
+                failed=True,
+                status_file=self.status_file,
+                manifest_file=self.manifest_file,
+                msg="directory {} not copied: {}. The next run resumes the copy.".format(self.source, e)
+            )
+
         return dict(
             changed=True,
             failed=False,
+            method=method,
+            progress=progress,
+            status_file=self.status_file,
             msg="directory {} synced to {}".format(self.source, self.destination)
         )
 
+    def backup_prepare(self):
+        """
+          online copy of the running server with mariabackup
+        """
+        snapshot = self.load_snapshot()
+
+        if snapshot.get("state") in ["prepared", "finalized"] and os.path.isdir(self.destination):
+            return dict(
+                changed=False,
+                failed=False,
+                msg="directory {} is already {}".format(self.destination, snapshot.get("state"))
+            )
+
+        if os.path.exists(self.destination) and os.listdir(self.destination):
+            return dict(
+                changed=False,
+                failed=True,
+                msg="directory {} exists and is not empty".format(self.destination)
+            )
+
+        backup_binary = self.module.get_bin_path("mariadb-backup", False) or self.module.get_bin_path("mariabackup", False)
+        mbstream_binary = self.module.get_bin_path("mbstream", False)
+
+        if not backup_binary or not mbstream_binary:
+            return dict(
+                changed=False,
+                failed=True,
+                msg="mariabackup and mbstream are required for an online migration"
+            )
+
+        source_stat = os.stat(self.source)
+
+        # every file which is changed after this point is copied again by 'finalized'
+        _, files, _ = scan_tree(self.source)
+        snapshot = dict(
+            source=self.source,
+            state="running",
+            files={path: [entry_stat.st_size, entry_stat.st_mtime_ns] for path, entry_stat in files},
+        )
+        self.save_snapshot(snapshot)
+
+        if not os.path.isdir(self.destination):
+            os.makedirs(self.destination, 0o0700)
+
+        # the defaults file has to be the first option
+        args = [backup_binary]
+
+        if self.config_file and os.path.exists(self.config_file):
+            args.append(f"--defaults-extra-file={self.config_file}")
+
+        args += ["--backup", "--stream=mbstream", f"--target-dir={self.destination}", f"--datadir={self.source}"]
+
+        if self.login_user:
+            args.append(f"--user={self.login_user}")
+
+        if self.login_unix_socket:
+            args.append(f"--socket={self.login_unix_socket}")
+
+        command = "{} | {} -x -C {}".format(
+            " ".join([shlex.quote(x) for x in args]),
+            shlex.quote(mbstream_binary),
+            shlex.quote(self.destination)
+        )
+
+        # pipefail: a failed mariabackup must not be hidden by mbstream, which extracts the truncated stream
+        bash_binary = self.module.get_bin_path("bash", True)
+
+        rc, out, err = self.module.run_command([bash_binary, "-o", "pipefail", "-c", command], environ_update=dict(LC_ALL="C"))
+
+        if rc == 0:
+            rc, out, err = self.module.run_command([backup_binary, "--prepare", f"--target-dir={self.destination}"])
+
+        if rc != 0:
+            return dict(
+                changed=True,
+                failed=True,
+                msg="mariabackup failed: {}".format(err.strip()[-2000:])
+            )
+
+        self.fix_ownership(self.destination, source_stat.st_uid, source_stat.st_gid)
+
+        snapshot["state"] = "prepared"
+        self.save_snapshot(snapshot)
+
+        return dict(
+            changed=True,
+            failed=False,
+            msg="directory {} prepared in {}, stop the server and run state 'finalized'".format(self.source, self.destination)
+        )
+
+    def backup_finalize(self):
+        """
+          delta sync of the stopped server into the prepared copy
+        """
+        snapshot = self.load_snapshot()
+
+        if snapshot.get("state") == "finalized":
+            return dict(
+                changed=False,
+                failed=False,
+                msg="directory {} is already finalized".format(self.destination)
+            )
+
+        if snapshot.get("state") != "prepared" or snapshot.get("source") != self.source:
+            return dict(
+                changed=False,
+                failed=True,
+                msg="no prepared copy of {} in {}, run state 'prepared' first".format(self.source, self.destination)
+            )
+
+        if self.server_running():
+            return dict(
+                changed=False,
+                failed=True,
+                msg="the server is still running, stop it before the final sync"
+            )
+
+        source_stat = os.stat(self.source)
+        directories, files, symlinks = scan_tree(self.source)
+        known = snapshot.get("files", {})
+
+        copied = []
+
+        try:
+            for path, entry_stat in directories:
+                destination = os.path.join(self.destination, path)
+                if not os.path.isdir(destination):
+                    os.mkdir(destination, stat.S_IMODE(entry_stat.st_mode))
+                    os.chown(destination, source_stat.st_uid, source_stat.st_gid)
+
+            for path, entry_stat in files:
+                changed_file = known.get(path) != [entry_stat.st_size, entry_stat.st_mtime_ns]
+
+                # redo log and system tablespaces are rewritten by --prepare
+                system_file = "/" not in path and any(fnmatch.fnmatch(path, x) for x in SYSTEM_FILES)
+
+                if changed_file or system_file:
+                    copy_file(
+                        os.path.join(self.source, path),
+                        os.path.join(self.destination, path),
+                        entry_stat,
+                        source_stat.st_uid,
+                        source_stat.st_gid,
+                        False
+                    )
+                    copied.append(path)
+
+            # remove backup metadata and files which were dropped on the source
+            wanted = set([x[0] for x in files] + [x[0] for x in symlinks] + [x[0] for x in directories])
+            _, destination_files, destination_symlinks = scan_tree(self.destination)
+
+            for path, _ in destination_files + destination_symlinks:
+                if path not in wanted:
+                    os.remove(os.path.join(self.destination, path))
+
+            for path, _ in symlinks:
+                destination = os.path.join(self.destination, path)
+                if os.path.lexists(destination):
+                    os.remove(destination)
+                os.symlink(os.readlink(os.path.join(self.source, path)), destination)
+                os.lchown(destination, source_stat.st_uid, source_stat.st_gid)
+
+            os.rename(self.source, "{}.dist".format(self.source))
+
+        except OSError as e:
+            return dict(
+                changed=len(copied) > 0,
+                failed=True,
+                msg="final sync of {} failed: {}".format(self.source, e)
+            )
+
+        snapshot["state"] = "finalized"
+        self.save_snapshot(snapshot)
+
+        return dict(
+            changed=True,
+            failed=False,
+            files_synced=len(copied),
+            msg="directory {} synced to {}".format(self.source, self.destination)
+        )
+
+    def server_running(self):
+        """
+          pid file, socket and a server process in the data directory
+        """
+        if self.pid_file and os.path.isfile(self.pid_file):
+            try:
+                with open(self.pid_file) as f:
+                    pid = int(f.read().strip())
+                os.kill(pid, 0)
+                return True
+            except (OSError, ValueError):
+                pass
+
+        if self.login_unix_socket and os.path.exists(self.login_unix_socket):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.login_unix_socket)
+                return True
+            except OSError:
+                pass
+            finally:
+                sock.close()
+
+        return len(self.server_processes()) > 0
+
+    def server_processes(self):
+        """
+          server processes in the data directory (the server changes into it)
+        """
+        result = []
+        source = os.path.realpath(self.source)
+
+        for pid in [x for x in os.listdir("/proc") if x.isdigit()]:
+            try:
+                with open(f"/proc/{pid}/comm") as f:
+                    name = f.read().strip()
+            except OSError:
+                continue
+
+            if name not in ["mariadbd", "mysqld"]:
+                continue
+
+            try:
+                cwd = os.path.realpath(os.readlink(f"/proc/{pid}/cwd"))
+            except FileNotFoundError:
+                continue
+            except OSError:
+                # the directory of a foreign process can't be read, it may be the source
+                cwd = source
+
+            if cwd == source:
+                result.append(int(pid))
+
+        return result
+
+    def fix_ownership(self, path, uid, gid):
+        """
+        """
+        directories, files, symlinks = scan_tree(path)
+
+        ensure_ownership(path, uid=uid, gid=gid)
+
+        for entry, _ in directories + files + symlinks:
+            ensure_ownership(os.path.join(path, entry), uid=uid, gid=gid)
+
+    def load_snapshot(self):
+        """
+        """
+        try:
+            with open(self.snapshot_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_snapshot(self, snapshot):
+        """
+        """
+        write_file_atomic(self.snapshot_file, json.dumps(snapshot, sort_keys=True), mode=0o0600)
+
+    def detect_method(self):
+        """
+          rename on the same filesystem, reflink clone if supported, full copy otherwise
+        """
+        if self.method != "auto":
+            return self.method
+
+        parent = os.path.dirname(self.destination.rstrip("/"))
+
+        if not self.keep_source and same_filesystem(self.source, parent):
+            return "rename"
+
+        if reflink_supported(self.source, parent):
+            return "reflink"
+
+        return "copy"
+
 
 def main():
     """
@@ -105,6 +614,58 @@ def main():
             required=True,
             type='path'
         ),
+        threads=dict(
+            required=False,
+            type='int',
+            default=4
+        ),
+        method=dict(
+            required=False,
+            type='str',
+            default='auto',
+            choices=['auto', 'rename', 'reflink', 'copy']
+        ),
+        keep_source=dict(
+            required=False,
+            type='bool',
+            default=False
+        ),
+        status_file=dict(
+            required=False,
+            type='path'
+        ),
+        manifest_file=dict(
+            required=False,
+            type='path'
+        ),
+        verify_checksum=dict(
+            required=False,
+            type='bool',
+            default=False
+        ),
+        state=dict(
+            required=False,
+            type='str',
+            default='moved',
+            choices=['moved', 'prepared', 'finalized']
+        ),
+        pid_file=dict(
+            required=False,
+            type='path'
+        ),
+        login_user=dict(
+            required=False,
+            type='str'
+        ),
+        login_unix_socket=dict(
+            required=False,
+            type='str'
+        ),
+        config_file=dict(
+            required=False,
+            type='path',
+            default='/root/.my.cnf'
+        ),
     )
 
     module = AnsibleModule(
@@ -0,0 +1,361 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import re
+import socket
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_capabilities import MariadbCapabilities
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_databases.py
+author:
+    - 'Bodo Schulz'
+short_description: create, change or remove a list of mariadb databases with a single call.
+description:
+    - Reads C(information_schema.SCHEMATA) once, compares it with the complete list of desired
+      databases and only executes the needed C(CREATE DATABASE), C(ALTER DATABASE) and
+      C(DROP DATABASE) statements.
+    - In a galera cluster the statements are only executed on the primary node, all other
+      nodes get the schemas through the cluster replication.
+options:
+  databases:
+    description:
+      - List of databases with the same keys as C(mariadb_databases).
+      - C(name) (required), C(encoding) (default C(utf8)), C(collation) (default C(utf8_general_ci)),
+        C(state) (default C(present)).
+    type: list
+    elements: dict
+    required: true
+  galera_cluster:
+    description:
+      - Run in galera mode. If not set, C(wsrep_on) of the running server is used.
+    type: bool
+    required: false
+  galera_primary_node:
+    description:
+      - Hostname of the galera primary node. Only this node executes the statements.
+    type: str
+    required: false
+  cache_directory:
+    description:
+      - Directory in which the probed server capabilities are cached.
+    type: path
+    required: false
+"""
+
+EXAMPLES = """
+- name: create or remove mariadb databases
+  mariadb_databases:
+    databases: "{{ mariadb_databases }}"
+    galera_cluster: "{{ mariadb_galera_cluster }}"
+    galera_primary_node: "{{ mariadb_galera_primary_node }}"
+    cache_directory: "{{ mariadb_config_dir }}"
+    login_user: "{{ _mariadb_root_system_user.username }}"
+    login_password: "{{ _mariadb_root_system_user.password }}"
+    login_unix_socket: "{{ mariadb_socket | default(omit) }}"
+    config_file: "{{ _mariadb_root_system_user.home | default('/root') }}/.my.cnf"
+"""
+
+RETURN = """
+databases:
+  description: changed report for every database
+  returned: always
+  type: list
+  sample:
+    - name: molecule
+      state: present
+      changed: true
+      queries:
+        - "CREATE DATABASE `molecule` CHARACTER SET utf8 COLLATE utf8_general_ci"
+queries:
+  description: all executed statements
+  returned: always
+  type: list
+"""
+
+# ---------------------------------------------------------------------------------------
+
+# never removed or changed by this module
+SYSTEM_SCHEMAS = [
+    "mysql",
+    "information_schema",
+    "performance_schema",
+    "sys",
+]
+
+VALID_NAME = re.compile(r"^[A-Za-z0-9_]+$")
+
+
+def normalize_charset(name):
+    """
+      since 10.6 'utf8' is shown as 'utf8mb3'
+    """
+    if not name:
+        return name
+
+    name = name.lower()
+
+    if name == "utf8":
+        return "utf8mb3"
+    if name.startswith("utf8_"):
+        return "utf8mb3_" + name[len("utf8_"):]
+
+    return name
+
+
+def quote_identifier(name):
+    """
+    """
+    return "`{}`".format(name.replace("`", "``"))
+
+
+class MariadbDatabases(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.databases = module.params.get("databases")
+        self.galera_cluster = module.params.get("galera_cluster")
+        self.galera_primary_node = module.params.get("galera_primary_node")
+        self.cache_directory = module.params.get("cache_directory")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
+
+        self.executed_queries = []
+
+    def run(self):
+        """
+        """
+        for database in self.databases:
+            name = database.get("name")
+
+            if name.lower() in SYSTEM_SCHEMAS:
+                return dict(
+                    failed=True,
+                    msg=f"the system schema '{name}' can't be managed."
+                )
+
+            for key in ["encoding", "collation"]:
+                if not VALID_NAME.match(database.get(key)):
+                    return dict(
+                        failed=True,
+                        msg=f"database '{name}': invalid {key} '{database.get(key)}'"
+                    )
+
+        # skip the connection at all on secondary galera nodes
+        if self.galera_cluster is True and not self._primary_node():
+            return self._skipped()
+
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
+
+        if error:
+            return dict(
+                failed=True,
+                msg=message
+            )
+
+        if self.galera_cluster is None:
+            capabilities = MariadbCapabilities(
+                self.module,
+                cache_directory=self.cache_directory,
+                socket=self.login_unix_socket
+            ).probe(cursor)
+
+            if capabilities.get("galera") and not self._primary_node():
+                conn.close()
+                return self._skipped()
+
+        schemas = self._read_schemas(cursor)
+
+        report = []
+        failed = False
+        msg = "all databases are up to date."
+
+        for database in self.databases:
+            statements = self._diff_database(database, schemas.get(database.get("name")))
+
+            entry = dict(
+                name=database.get("name"),
+                state=database.get("state"),
+                changed=len(statements) > 0,
+                queries=statements,
+            )
+            report.append(entry)
+
+            if self.module.check_mode:
+                continue
+
+            if failed:
+                # nothing was applied after the first error
+                entry["changed"] = False
+                continue
+
+            for query in statements:
+                try:
+                    self.executed_queries.append(query)
+                    cursor.execute(query)
+                except Exception as e:
+                    failed = True
+                    entry["failed"] = True
+                    msg = f"database '{database.get('name')}': {query} failed: {to_native(e)}"
+                    break
+
+        conn.close()
+
+        changed = any(x.get("changed") for x in report)
+
+        if changed and not failed:
+            msg = f"{len([x for x in report if x.get('changed')])} database(s) changed."
+
+        return dict(
+            changed=changed,
+            failed=failed,
+            msg=msg,
+            databases=report,
+            queries=self.executed_queries
+        )
+
+    def _primary_node(self):
+        """
+        """
+        if not self.galera_primary_node:
+            return True
+
+        fqdn = socket.getfqdn()
+        hostname = socket.gethostname()
+
+        return self.galera_primary_node in [hostname, hostname.split(".")[0], fqdn]
+
+    def _skipped(self):
+        """
+        """
+        return dict(
+            changed=False,
+            msg=f"galera cluster: databases are only managed on the primary node '{self.galera_primary_node}'.",
+            databases=[],
+            queries=[]
+        )
+
+    def _read_schemas(self, cursor):
+        """
+          {'name': {'encoding': 'utf8mb4', 'collation': 'utf8mb4_general_ci'}}
+        """
+        result = {}
+
+        cursor.execute(
+            "SELECT SCHEMA_NAME, DEFAULT_CHARACTER_SET_NAME, DEFAULT_COLLATION_NAME FROM information_schema.SCHEMATA"
+        )
+
+        for name, encoding, collation in cursor.fetchall():
+            result[name] = dict(
+                encoding=encoding,
+                collation=collation,
+            )
+
+        return result
+
+    def _diff_database(self, database, current):
+        """
+          returns a list of queries
+        """
+        name = quote_identifier(database.get("name"))
+        encoding = database.get("encoding")
+        collation = database.get("collation")
+
+        if database.get("state") == "absent":
+            if current is not None:
+                return [f"DROP DATABASE {name}"]
+            return []
+
+        if current is None:
+            return [f"CREATE DATABASE {name} CHARACTER SET {encoding} COLLATE {collation}"]
+
+        encoding_changed = normalize_charset(current.get("encoding")) != normalize_charset(encoding)
+        collation_changed = normalize_charset(current.get("collation")) != normalize_charset(collation)
+
+        if encoding_changed or collation_changed:
+            return [f"ALTER DATABASE {name} CHARACTER SET {encoding} COLLATE {collation}"]
+
+        return []
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        databases=dict(
+            required=True,
+            type='list',
+            elements='dict',
+            options=dict(
+                name=dict(type='str', required=True),
+                encoding=dict(type='str', default='utf8'),
+                collation=dict(type='str', default='utf8_general_ci'),
+                state=dict(type='str', default='present', choices=['present', 'absent']),
+            )
+        ),
+        galera_cluster=dict(
+            required=False,
+            type='bool'
+        ),
+        galera_primary_node=dict(
+            required=False,
+            type='str'
+        ),
+        cache_directory=dict(
+            required=False,
+            type='path'
+        ),
+    )
+    specs.update(broker_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbDatabases(module)
+    result = client.run()
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
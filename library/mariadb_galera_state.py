@@ -0,0 +1,318 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import time
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_connection import mariadb_connect
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_galera_state.py
+author:
+    - 'Bodo Schulz'
+short_description: health state of a galera cluster node.
+description:
+    - Reads the C(wsrep_%) status of the local galera node.
+    - With I(state=synced) the module waits until the node is C(Synced), C(wsrep_ready) is C(ON),
+      the cluster is C(Primary) and has at least I(cluster_size) members.
+      A node which is still starting (or receives a SST) is polled until I(timeout).
+    - With I(seqno) the module checks if the gcache of this node still contains all write sets after
+      I(seqno), in this case a restarted node with this position can join with IST instead of SST.
+options:
+  state:
+    description:
+      - C(status) only returns the current state, C(synced) waits for a healthy node.
+    type: str
+    choices: [status, synced]
+    default: status
+  cluster_size:
+    description:
+      - The number of nodes of the complete cluster.
+    type: int
+    required: false
+  seqno:
+    description:
+      - The last committed position of a node which should join with IST (C(wsrep_last_committed)).
+    type: int
+    required: false
+  timeout:
+    description:
+      - Seconds to wait for I(state=synced).
+    type: int
+    default: 600
+  interval:
+    description:
+      - Seconds between two checks.
+    type: int
+    default: 5
+"""
+
+EXAMPLES = """
+- name: galera node state
+  mariadb_galera_state:
+    login_unix_socket: "{{ mariadb_socket }}"
+    config_file: /root/.my.cnf
+  register: _galera_state
+
+- name: can the gcache of this donor serve an IST?
+  mariadb_galera_state:
+    seqno: "{{ _galera_state.status.last_committed }}"
+    login_unix_socket: "{{ mariadb_socket }}"
+  delegate_to: database-2
+
+- name: wait for the synced node
+  mariadb_galera_state:
+    state: synced
+    cluster_size: 3
+    timeout: 900
+    login_unix_socket: "{{ mariadb_socket }}"
+"""
+
+RETURN = """
+status:
+  description: the wsrep status of the node
+  returned: always
+  type: dict
+  sample:
+    local_state_comment: Synced
+    ready: "ON"
+    connected: "ON"
+    cluster_status: Primary
+    cluster_size: 3
+    last_committed: 18264
+    local_cached_downto: 12001
+synced:
+  description: the node is healthy
+  returned: always
+  type: bool
+ist_possible:
+  description: the gcache of this node contains all write sets after I(seqno)
+  returned: if I(seqno) is set
+  type: bool
+"""
+
+# ---------------------------------------------------------------------------------------
+
+# gcache without any write set: -1 or 2^64-1
+GCACHE_EMPTY = [-1, 18446744073709551615]
+
+
+class MariadbGaleraState(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.state = module.params.get("state")
+        self.cluster_size = module.params.get("cluster_size")
+        self.seqno = module.params.get("seqno")
+        self.timeout = module.params.get("timeout")
+        self.interval = module.params.get("interval")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+
+    def run(self):
+        """
+        """
+        if self.state == "synced":
+            return self.wait_synced()
+
+        status, error = self.read_status()
+
+        if error:
+            return dict(
+                failed=True,
+                synced=False,
+                status={},
+                msg=error
+            )
+
+        result = dict(
+            changed=False,
+            synced=self.healthy(status),
+            status=status,
+            msg=f"node is {status.get('local_state_comment')}, cluster size {status.get('cluster_size')}."
+        )
+
+        if self.seqno is not None:
+            result["ist_possible"] = self.ist_possible(status)
+
+        return result
+
+    def wait_synced(self):
+        """
+          poll until the node is healthy, a restarting node isn't reachable for a while
+        """
+        deadline = time.time() + self.timeout
+        status = {}
+        error = None
+
+        while True:
+            status, error = self.read_status()
+
+            if not error and self.healthy(status):
+                return dict(
+                    changed=False,
+                    synced=True,
+                    status=status,
+                    msg=f"node is Synced, cluster size {status.get('cluster_size')}."
+                )
+
+            if time.time() + self.interval > deadline:
+                break
+
+            time.sleep(self.interval)
+
+        if error:
+            msg = f"node not reachable after {self.timeout} seconds: {error}"
+        else:
+            msg = (
+                f"node not synced after {self.timeout} seconds: state {status.get('local_state_comment')}, "
+                f"ready {status.get('ready')}, cluster {status.get('cluster_status')} with {status.get('cluster_size')} node(s)"
+            )
+
+        return dict(
+            failed=True,
+            synced=False,
+            status=status,
+            msg=msg
+        )
+
+    def read_status(self):
+        """
+          returns (status, error)
+        """
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+        )
+
+        if error:
+            return ({}, message)
+
+        try:
+            cursor.execute("SHOW GLOBAL STATUS LIKE 'wsrep%'")
+            rows = {name.lower(): value for name, value in cursor.fetchall()}
+
+        except Exception as e:
+            return ({}, to_native(e))
+
+        finally:
+            conn.close()
+
+        if not rows:
+            return ({}, "the server is not a galera cluster node.")
+
+        return (
+            dict(
+                local_state_comment=rows.get("wsrep_local_state_comment"),
+                ready=rows.get("wsrep_ready"),
+                connected=rows.get("wsrep_connected"),
+                cluster_status=rows.get("wsrep_cluster_status"),
+                cluster_size=self.to_int(rows.get("wsrep_cluster_size")),
+                last_committed=self.to_int(rows.get("wsrep_last_committed")),
+                local_cached_downto=self.to_int(rows.get("wsrep_local_cached_downto")),
+            ),
+            None
+        )
+
+    def healthy(self, status):
+        """
+        """
+        return all([
+            status.get("local_state_comment") == "Synced",
+            status.get("ready") == "ON",
+            status.get("cluster_status") == "Primary",
+            not self.cluster_size or (status.get("cluster_size") or 0) >= self.cluster_size,
+        ])
+
+    def ist_possible(self, status):
+        """
+          the joiner needs all write sets after its position
+        """
+        cached_downto = status.get("local_cached_downto")
+
+        if cached_downto is None or cached_downto in GCACHE_EMPTY:
+            return False
+
+        return 0 < cached_downto <= self.seqno + 1
+
+    def to_int(self, value):
+        """
+        """
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        state=dict(
+            required=False,
+            type='str',
+            choices=['status', 'synced'],
+            default='status'
+        ),
+        cluster_size=dict(
+            required=False,
+            type='int'
+        ),
+        seqno=dict(
+            required=False,
+            type='int'
+        ),
+        timeout=dict(
+            required=False,
+            type='int',
+            default=600
+        ),
+        interval=dict(
+            required=False,
+            type='int',
+            default=5
+        ),
+    )
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbGaleraState(module)
+    result = client.run()
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
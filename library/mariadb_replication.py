@@ -9,7 +9,6 @@
 
 from __future__ import absolute_import, division, print_function
 
-import os
 import warnings
 
 from ansible.module_utils.basic import AnsibleModule
@@ -20,7 +19,8 @@ from ansible.module_utils.mysql import (
     mysql_common_argument_spec
 )
 from ansible.module_utils._text import to_native
-from distutils.version import LooseVersion
+from ansible.module_utils.mariadb_capabilities import MariadbCapabilities
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
 
 __metaclass__ = type
 
@@ -59,6 +59,22 @@ options:
     - reset_replica
     - reset_replica_all
     default: get_replica
+  steps:
+    description:
+    - Ordered list of operating modes which are executed over the same connection.
+    - Accepts the same values as I(mode). When set, I(mode) is ignored.
+    - The pipeline stops at the first failed step.
+    type: list
+    elements: str
+    choices:
+    - change_primary
+    - get_primary
+    - get_replica
+    - start_replica
+    - stop_replica
+    - reset_primary
+    - reset_replica
+    - reset_replica_all
   primary_host:
     description:
     - Same as the C(MASTER_HOST) mariadb variable.
@@ -183,6 +199,24 @@ options:
     type: bool
     default: False
     version_added: '0.1.0'
+  cache_directory:
+    description:
+    - Directory in which the probed server capabilities are cached.
+    - The cache is invalidated when the server is restarted or its binary changes.
+    - Without this option the server is probed on every call.
+    type: path
+  use_broker:
+    description:
+    - Execute the statements over a long-lived local connection broker.
+    - The broker is started on demand and reused by later module calls with the same
+      connection parameters, so the connection handshake is done only once per play.
+    type: bool
+    default: false
+  broker_ttl:
+    description:
+    - Seconds without any client after which the connection broker terminates.
+    type: int
+    default: 300
 
 notes:
 - If an empty value for the parameter of string type is needed, use an empty string.
@@ -264,6 +298,17 @@ EXAMPLES = r'''
     mode: change_primary
     fail_on_error: true
 
+- name: Reconfigure and restart the replica with a single module call
+  mariadb_replication:
+    steps:
+      - stop_replica
+      - change_primary
+      - start_replica
+      - get_replica
+    primary_host: 192.0.2.1
+    primary_log_file: mysql-bin.000009
+    primary_log_pos: 4578
+
 '''
 
 RETURN = r'''
@@ -273,6 +318,14 @@ queries:
   type: list
   sample: ["CHANGE MASTER TO MASTER_HOST='primary2.example.com',MASTER_PORT=3306"]
   version_added: '0.1.0'
+steps:
+  description:
+    - One result per executed step, in the order of I(steps).
+    - Every entry contains the C(mode) of the step and the same keys
+      as the single I(mode) call would return (without C(queries)).
+  returned: when I(steps) is set
+  type: list
+  sample: [{"mode": "stop_replica", "changed": true, "msg": "Replica stopped"}]
 '''
 
 
@@ -292,7 +345,10 @@ class MariadbReplication():
         self.login_password = self.module.params.get("login_password")
         self.login_username = self.module.params.get("login_user")
         self.login_unix_socket = self.module.params.get("login_unix_socket")
+        self.login_host = self.module.params.get("login_host")
+        self.login_port = self.module.params.get("login_port")
         self.mode = module.params.get("mode")
+        self.steps = module.params.get("steps")
         self.primary_host = module.params.get("primary_host")
         self.primary_user = module.params.get("primary_user")
         self.primary_password = module.params.get("primary_password")
@@ -324,6 +380,9 @@ class MariadbReplication():
         self.connection_name = module.params.get("connection_name")
         self.channel = module.params.get("channel")
         self.fail_on_error = module.params.get("fail_on_error")
+        self.cache_directory = module.params.get("cache_directory")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
 
         self.primary_term = 'MASTER'
         self.replica_term = 'SLAVE'
@@ -336,14 +395,24 @@ class MariadbReplication():
     def run(self):
         """
         """
-        result = dict(failed=True)
-
         if mysql_driver is None:
             self.module.fail_json(msg=mysql_driver_fail_msg)
         else:
             warnings.filterwarnings('error', category=mysql_driver.Warning)
 
-        cursor, conn, error, message = self._mysql_connect()
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+            dict_cursor=True,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
 
         if error:
             return dict(
@@ -353,19 +422,69 @@ class MariadbReplication():
 
         self.prepare(cursor)
 
-        if self.mode == 'get_primary':
+        if self.steps:
+            result = self.run_steps(cursor)
+        else:
+            result = self.run_mode(cursor, self.mode)
+
+        warnings.simplefilter("ignore")
+
+        return result
+
+    def run_steps(self, cursor):
+        """
+          run an ordered list of modes over the same connection.
+          the pipeline stops at the first failed step.
+        """
+        changed = False
+        failed = False
+        results = []
+
+        for step in self.steps:
+            step_result = self.run_mode(cursor, step)
+            step_result.pop("queries", None)
+            step_result["mode"] = step
+
+            results.append(step_result)
+
+            if step_result.get("changed", False):
+                changed = True
+
+            if step_result.get("failed", False):
+                failed = True
+                break
+
+        result = dict(
+            changed=changed,
+            failed=failed,
+            steps=results,
+            queries=self.executed_queries,
+        )
+
+        if failed:
+            result["msg"] = f"step '{results[-1].get('mode')}' failed: {results[-1].get('msg')}"
+
+        return result
+
+    def run_mode(self, cursor, mode):
+        """
+          run a single mode and return its result
+        """
+        result = dict(failed=True)
+
+        if mode == 'get_primary':
             """
               get primary information
             """
             result = self.get_primary(cursor)
 
-        elif self.mode == "get_replica":
+        elif mode == "get_replica":
             """
               get replica state
             """
             result = self.get_replica(cursor)
 
-        elif self.mode == "change_primary":
+        elif mode == "change_primary":
             """
             """
             result = {}
@@ -375,128 +494,124 @@ class MariadbReplication():
             except mysql_driver.Warning as e:
                 result['warning'] = to_native(e)
             except Exception as e:
-                self.module.fail_json(
-                    msg=f"{to_native(e)}. Query == CHANGE MASTER TO ...")
+                return dict(
+                    failed=True,
+                    changed=False,
+                    msg=f"{to_native(e)}. Query == CHANGE MASTER TO ...",
+                    queries=self.executed_queries
+                )
 
             result['changed'] = True
+            result['queries'] = self.executed_queries
 
-            self.module.exit_json(queries=self.executed_queries, **result)
-
-        elif self.mode in ("start_replica"):
+        elif mode == "start_replica":
             """
             """
             started = self.start_replica(cursor)
+
             if started is True:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica started ",
                     changed=True,
                     queries=self.executed_queries
                 )
             else:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica already started (Or cannot be started)",
                     changed=False,
                     queries=self.executed_queries
                 )
 
-        elif self.mode in ("stop_replica"):
+        elif mode == "stop_replica":
             """
             """
             stopped = self.stop_replica(cursor)
 
             if stopped is True:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica stopped",
                     changed=True,
                     queries=self.executed_queries
                 )
             else:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica already stopped",
                     changed=False,
                     queries=self.executed_queries
                 )
 
-        elif self.mode in ("reset_primary"):
+        elif mode == "reset_primary":
             """
             """
             reset = self.reset_primary(cursor)
 
             if reset is True:
-                self.module.exit_json(
+                result = dict(
                     msg="Primary reset",
                     changed=True,
                     queries=self.executed_queries
                 )
             else:
-                self.module.exit_json(
+                result = dict(
                     msg="Primary already reset",
                     changed=False,
                     queries=self.executed_queries
                 )
 
-        elif self.mode in ("reset_replica"):
+        elif mode == "reset_replica":
             """
             """
             reset = self.reset_replica(cursor)
 
             if reset is True:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica reset",
                     changed=True,
                     queries=self.executed_queries
                 )
             else:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica already reset",
                     changed=False,
                     queries=self.executed_queries
                 )
 
-        elif self.mode in ("reset_replica_all"):
+        elif mode == "reset_replica_all":
             """
             """
             reset = self.reset_replica_all(cursor)
 
             if reset is True:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica reset",
                     changed=True,
                     queries=self.executed_queries
                 )
             else:
-                self.module.exit_json(
+                result = dict(
                     msg="Replica already reset",
                     changed=False,
                     queries=self.executed_queries
                 )
 
-        warnings.simplefilter("ignore")
-
         return result
 
     def prepare(self, cursor):
         """
         """
-        cursor.execute("SELECT VERSION() as version")
-
-        curser_fetched = cursor.fetchone()
+        capabilities = MariadbCapabilities(
+            self.module,
+            cache_directory=self.cache_directory,
+            socket=self.login_unix_socket
+        ).probe(cursor)
 
-        if curser_fetched is not None:
-            # self.module.log(f"- cursor: {curser_fetched} ({type(curser_fetched)})")
-
-            if isinstance(curser_fetched, dict):
-                version = curser_fetched["version"].lower()
-            else:
-                version = curser_fetched[0].lower()
+        # self.module.log(f"- capabilities: {capabilities}")
 
-            # self.module.log(f"- version: {LooseVersion(version)}")
-
-            if LooseVersion(version) >= LooseVersion('10.5.1'):  # or LooseVersion(result) >= LooseVersion('8.0.22'):
-                # self.primary_term = 'PRIMARY'
-                self.replica_term = 'REPLICA'
-                if self.primary_use_gtid == 'slave_pos':
-                    self.primary_use_gtid = 'replica_pos'
+        if capabilities.get("replica_term") == 'REPLICA':
+            # self.primary_term = 'PRIMARY'
+            self.replica_term = 'REPLICA'
+            if self.primary_use_gtid == 'slave_pos':
+                self.primary_use_gtid = 'replica_pos'
 
     def get_primary(self, cursor):
         """
@@ -776,55 +891,6 @@ class MariadbReplication():
         self.executed_queries.append(query)
         cursor.execute(query)
 
-    def _mysql_connect(self):
-        """
-        """
-        _mysql_cursor_param = 'cursor'
-
-        config = {}
-
-        config_file = self.config_file
-
-        if config_file and os.path.exists(config_file):
-            config['read_default_file'] = config_file
-
-        # If dba_user or dba_password are given, they should override the
-        # config file
-        if self.login_username is not None:
-            config['user'] = self.login_username
-        if self.login_password is not None:
-            config['passwd'] = self.login_password
-
-        if self.login_unix_socket is not None and os.path.exists(self.login_unix_socket):
-            config['unix_socket'] = self.login_unix_socket
-
-        # self.module.log(msg=f"config : {config}")
-
-        if mysql_driver is None:
-            self.module.fail_json(msg=mysql_driver_fail_msg)
-
-        try:
-            db_connection = mysql_driver.connect(**config)
-
-        except Exception as e:
-            message = "unable to connect to database. "
-            message += "check login_host, login_user and login_password are correct "
-            message += f"or {config_file} has the credentials. "
-            message += f"Exception message: {to_native(e)}"
-
-            self.module.log(msg=message)
-
-            return (None, None, True, message)
-
-        return (
-            db_connection.cursor(
-                **{_mysql_cursor_param: mysql_driver.cursors.DictCursor}
-            ),
-            db_connection,
-            False,
-            "successful connected"
-        )
-
     def _parse_from_mysql_config_file(self, cnf):
         cp = configparser.ConfigParser()
         cp.read(cnf)
@@ -834,20 +900,26 @@ class MariadbReplication():
 def main():
     """
     """
+    modes = [
+        'get_primary',
+        'get_replica',
+        'change_primary',
+        'stop_replica',
+        'start_replica',
+        'reset_primary',
+        'reset_replica',
+        'reset_replica_all',
+    ]
+
     specs = mysql_common_argument_spec()
     specs.update(
         mode=dict(
             type='str',
-            default='get_replica', choices=[
-                'get_primary',
-                'get_replica',
-                'change_primary',
-                'stop_replica',
-                'start_replica',
-                'reset_primary',
-                'reset_replica',
-                'reset_replica_all',
-            ]),
+            default='get_replica', choices=modes),
+        steps=dict(
+            type='list',
+            elements='str',
+            choices=modes),
         primary_auto_position=dict(type='bool', default=False),
         primary_host=dict(type='str'),
         primary_user=dict(type='str'),
@@ -873,7 +945,9 @@ def main():
         connection_name=dict(type='str'),
         channel=dict(type='str'),
         fail_on_error=dict(type='bool', default=False),
+        cache_directory=dict(type='path'),
     )
+    specs.update(broker_argument_spec())
 
     module = AnsibleModule(
         argument_spec=specs,
@@ -6,17 +6,14 @@
 
 from __future__ import absolute_import, division, print_function
 import os
+import hmac
+import json
 import hashlib
 
+from ansible.module_utils._text import to_native
 from ansible.module_utils.basic import AnsibleModule
-
-try:
-    from configparser import ConfigParser, DuplicateSectionError
-    from configparser import NoSectionError, NoOptionError
-except ImportError:
-    # ver. < 3.0
-    from ConfigParser import ConfigParser, DuplicateSectionError
-    from ConfigParser import NoSectionError, NoOptionError
+from ansible.module_utils.mariadb_connection import mariadb_connect
+from ansible.module_utils.mariadb_file import update_ini, write_file_atomic
 
 
 DOCUMENTATION = """
@@ -25,7 +22,19 @@ module: mariadb_root_password.py
 author:
     - 'Bodo Schulz'
 short_description: set or change the root password and write the /root/.my.cnf file
-description: ''
+description:
+    - Sets the password over a database connection, no client binary is needed.
+    - The current password is verified against the hashes of the account in
+      C(mysql.global_priv) (or C(mysql.user) before 10.4).
+options:
+  dba_config_directory:
+    description:
+      - Directory for the state of the last set password (salted PBKDF2 digest and
+        a fingerprint of the account on the server).
+      - With a matching state only a login with the password and one query are needed,
+        changes outside of this module are detected by the fingerprint.
+    type: path
+    required: false
 """
 
 EXAMPLES = """
@@ -42,6 +51,9 @@ EXAMPLES = """
 
 # ---------------------------------------------------------------------------------------
 
+STATE_VERSION = 1
+STATE_ITERATIONS = 100000
+
 
 class MariaDBRootPassword(object):
     """
@@ -62,7 +74,10 @@ class MariaDBRootPassword(object):
         self.dba_config_directory = module.params.get("dba_config_directory")
         self.mycnf_file = module.params.get("mycnf_file")
 
-        self.checksum_file = os.path.join(self.dba_config_directory, ".rootpw_configured")
+        self.checksum_file = None
+
+        if self.dba_config_directory:
+            self.checksum_file = os.path.join(self.dba_config_directory, ".rootpw_configured")
 
         # self.module.log(msg="-------------------------------------------------------------")
         # self.module.log(msg=f"username      : {self.dba_root_username}")
@@ -80,152 +95,242 @@ class MariaDBRootPassword(object):
         """
           runner
         """
-        checksum_file_exists = os.path.exists(self.checksum_file)
+        state = self._load_state()
 
-        old_checksum = ""
-        new_checksum = ""
-
-        if checksum_file_exists:
-            """
-            """
-            with open(self.checksum_file) as f:
-                old_checksum = f.readline()
-
-        new_checksum = self._checksum(self.dba_root_password)
-
-        if old_checksum == new_checksum:
+        # fast path: same password as the last run and the account is unchanged on the server
+        if state and self._probe(state):
             return dict(
-                changed=False,
+                changed=self._write_mycnf(),
                 msg="password was not changed"
             )
 
-        self._write_mycnf()
+        cursor, conn, error, message = self._connect()
 
-        mysqladmin_binary = self.module.get_bin_path("mysqladmin", False)
+        if error:
+            return dict(
+                failed=True,
+                msg=message
+            )
 
-        args = [mysqladmin_binary]
-        args.append("--user")
-        args.append("root")
+        changed = False
 
-        if self.dba_bind_address:
-            args.append("--host")
-            args.append(self.dba_bind_address)
+        try:
+            account, hashes = self._account_hashes(cursor)
 
-        if self.dba_root_password:
-            args.append("password")
-            args.append(self.dba_root_password)
+            if self._password_hash(self.dba_root_password) not in hashes:
+                # SET PASSWORD only replaces the password based authentication and keeps
+                # an additional unix_socket authentication of the account (like 'mysqladmin password')
+                cursor.execute("SET PASSWORD = PASSWORD(%s)", (self.dba_root_password,))
+                changed = True
 
-        self.module.log(msg=f" - args: {args}")
+                account, hashes = self._account_hashes(cursor)
 
-        rc, out, err = self._exec(command=args, check_rc=False)
+        except Exception as e:
+            conn.close()
 
-        if rc != 0:
             return dict(
                 failed=True,
-                msg=f"{out} / {err}"
+                msg=f"can't set the root password: {to_native(e)}"
             )
 
+        conn.close()
+
+        mycnf_changed = self._write_mycnf()
+        self._save_state(account, hashes)
+
+        return dict(
+            changed=changed or mycnf_changed,
+            msg="password was successful set" if changed else "password was not changed"
+        )
+
+    def _load_state(self):
         """
-          persist checksum
+          the state of the last run, if it was created with the same password.
+          the plain checksum of older versions is handled as missing state.
         """
-        with open(self.checksum_file, "w") as checksum_file:
-            checksum_file.write(new_checksum)
+        if not self.checksum_file or not os.path.exists(self.checksum_file):
+            return None
 
-        return dict(
-            changed=True,
-            msg="password was successful set"
+        try:
+            with open(self.checksum_file) as f:
+                state = json.load(f)
+
+            salt = bytes.fromhex(state.get("salt"))
+            digest = self._digest(self.dba_root_password, salt, state.get("iterations"))
+
+        except (OSError, ValueError, TypeError, AttributeError):
+            return None
+
+        if not hmac.compare_digest(digest, state.get("digest", "")):
+            return None
+
+        return state
+
+    def _save_state(self, account, hashes):
+        """
+        """
+        if not self.checksum_file:
+            return
+
+        salt = os.urandom(16)
+
+        state = dict(
+            version=STATE_VERSION,
+            salt=salt.hex(),
+            iterations=STATE_ITERATIONS,
+            digest=self._digest(self.dba_root_password, salt, STATE_ITERATIONS),
+            fingerprint=self._fingerprint(salt, account, hashes),
         )
 
-    def _write_mycnf(self):
+        try:
+            write_file_atomic(self.checksum_file, json.dumps(state, indent=2, sort_keys=True), mode=0o0600)
+        except OSError as e:
+            self.module.log(msg=f"WARNING: can't write password state {self.checksum_file}: {e}")
+
+    def _probe(self, state):
+        """
+          cheap auth probe: log in with the password only and compare the
+          fingerprint of the account with the state of the last run.
+        """
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.dba_root_username,
+            login_password=self.dba_root_password,
+            login_unix_socket=self.dba_socket,
+            login_host=self.dba_bind_address,
+            connect_timeout=10,
+        )
+
+        if error:
+            return False
+
+        try:
+            account, hashes = self._account_hashes(cursor)
+        except Exception as e:
+            self.module.log(msg=f"WARNING: can't read the account: {to_native(e)}")
+            return False
+        finally:
+            conn.close()
+
+        salt = bytes.fromhex(state.get("salt"))
+
+        valid = hmac.compare_digest(self._fingerprint(salt, account, hashes), state.get("fingerprint", ""))
+
+        if not valid:
+            self.module.log(msg="the account was changed outside of this module")
+
+        return valid
+
+    def _digest(self, plaintext, salt, iterations):
         """
         """
-        ini_password = None
-        ini_username = None
-        ini_socket = None
-        ini_hostname = None
-
-        if ConfigParser:
-            """
-              write ini style my.cnf
-            """
-            config = ConfigParser()
-
-            try:
-                config.read(self.mycnf_file)
-            except Exception as e:
-                self.module.log(msg=f" ERROR : {e}")
-                return
-
-            try:
-                ini_username = config.get('client', 'user')
-
-                try:
-                    ini_password = config.get('client', 'password')
-                except NoOptionError:
-                    # self.module.log(msg=" WARNING : {}".format(e))
-                    pass
-
-                try:
-                    ini_socket = config.get('client', 'socket')
-                except NoOptionError:
-                    # self.module.log(msg=" WARNING : {}".format(e))
-                    pass
-
-                try:
-                    ini_hostname = config.get('client', 'host')
-                except NoOptionError:
-                    # self.module.log(msg=" WARNING : {}".format(e))
-                    pass
-
-            except NoSectionError:
-                # self.module.log(msg=" WARNING : {}".format(e))
-                pass
-
-            # self.module.log(msg=f"  - username: {ini_username}")
-            # self.module.log(msg=f"  - password: {ini_password}")
-            # self.module.log(msg=f"  - socket  : {ini_socket}")
-            # self.module.log(msg=f"  - hostname: {ini_hostname}")
-
-            try:
-                config.add_section('client')
-            except DuplicateSectionError:
-                # self.module.log(msg=" WARNING : {}".format(e))
-                pass
-
-            config.set('client', 'user', self.dba_root_username)
-            config.set('client', 'password', self.dba_root_password)
-
-            if self.dba_socket:
-                config.set('client', 'socket', self.dba_socket)
-
-            if self.dba_bind_address:
-                config.set('client', 'host', self.dba_bind_address)
-
-            # config_content = {section: dict(config[section]) for section in config.sections()}
-            # self.module.log(msg=f" config: {config_content}")
-
-            with open(self.mycnf_file, 'w') as configfile:
-                config.write(configfile)
-
-    def _exec(self, command, check_rc=True):
+        return hashlib.pbkdf2_hmac("sha256", plaintext.encode("utf-8"), salt, int(iterations)).hex()
+
+    def _fingerprint(self, salt, account, hashes):
+        """
+          the server side state of the account, without storing its password hashes
+        """
+        data = "\n".join([account] + sorted(hashes)).encode("utf-8")
+
+        return hmac.new(salt, data, hashlib.sha256).hexdigest()
+
+    def _connect(self):
         """
-          execute commands
+          try the new password, the passwordless unix_socket authentication
+          and the credentials of the existing my.cnf
         """
-        rc, out, err = self.module.run_command(command, check_rc=check_rc)
-        self.module.log(msg=f"  rc : '{rc}'")
+        attempts = [
+            dict(login_password=self.dba_root_password),
+            dict(login_password=None),
+            dict(login_password=None, config_file=self.mycnf_file),
+        ]
+
+        message = None
+
+        for attempt in attempts:
+            cursor, conn, error, message = mariadb_connect(
+                self.module,
+                login_user=self.dba_root_username,
+                login_unix_socket=self.dba_socket,
+                login_host=self.dba_bind_address,
+                connect_timeout=10,
+                **attempt
+            )
+
+            if not error:
+                return (cursor, conn, False, message)
+
+        return (None, None, True, message)
 
-        if rc != 0:
-            self.module.log(msg=f"  out: '{out}'")
-            self.module.log(msg=f"  err: '{err}'")
+    def _account_hashes(self, cursor):
+        """
+          the connected account and its mysql_native_password hashes
+        """
+        cursor.execute("SELECT CURRENT_USER()")
+        account = cursor.fetchone()[0]
+        user, host = account.rsplit("@", 1)
 
-        return rc, out, err
+        return account, self._password_hashes(cursor, user, host)
 
-    def _checksum(self, plaintext):
+    def _password_hashes(self, cursor, user, host):
         """
+          all mysql_native_password hashes of an account.
+          since 10.4 an account can have several authentications ('auth_or') in mysql.global_priv
         """
-        password_bytes = plaintext.encode('utf-8')
-        password_hash = hashlib.sha256(password_bytes)
-        return password_hash.hexdigest()
+        result = []
+
+        try:
+            cursor.execute("SELECT Priv FROM mysql.global_priv WHERE User = %s AND Host = %s", (user, host))
+            row = cursor.fetchone()
+        except Exception:
+            row = None
+
+            # before 10.4
+            cursor.execute("SELECT authentication_string, Password FROM mysql.user WHERE User = %s AND Host = %s", (user, host))
+            for x in cursor.fetchall():
+                result += [y for y in x if y]
+
+        if row:
+            priv = json.loads(row[0])
+
+            for auth in [priv] + priv.get("auth_or", []):
+                if auth.get("plugin", priv.get("plugin")) in ("mysql_native_password", None):
+                    value = auth.get("authentication_string", priv.get("authentication_string"))
+                    if value:
+                        result.append(value)
+
+        return result
+
+    def _password_hash(self, plaintext):
+        """
+          the same hash as PASSWORD() for mysql_native_password
+        """
+        stage1 = hashlib.sha1(plaintext.encode("utf-8")).digest()
+        return "*" + hashlib.sha1(stage1).hexdigest().upper()
+
+    def _write_mycnf(self):
+        """
+          set the client credentials in my.cnf, all other content is kept.
+          returns True if the file was changed.
+        """
+        content = ""
+
+        if os.path.exists(self.mycnf_file):
+            with open(self.mycnf_file) as f:
+                content = f.read()
+
+        options = dict(
+            user=self.dba_root_username,
+            password=self.dba_root_password,
+        )
+
+        if self.dba_socket:
+            options["socket"] = self.dba_socket
+
+        if self.dba_bind_address:
+            options["host"] = self.dba_bind_address
+
+        return write_file_atomic(self.mycnf_file, update_ini(content, "client", options), mode=0o0600)
 
 
 def main():
@@ -249,7 +354,7 @@ def main():
             type='str'
         ),
         dba_config_directory=dict(
-            required=True,
+            required=False,
             type='path'
         ),
         mycnf_file=dict(
@@ -5,30 +5,49 @@
 # Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
 
 from __future__ import absolute_import, division, print_function
-import os
 
 from ansible.module_utils._text import to_native
 from ansible.module_utils.basic import AnsibleModule
 from ansible.module_utils.six.moves import configparser
-from ansible.module_utils.mysql import mysql_driver, mysql_driver_fail_msg
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
 
 # ---------------------------------------------------------------------------------------
 
 DOCUMENTATION = """
 ---
-module: mysql_schema.py
+module: mariadb_secure.py
 author:
     - 'Bodo Schulz'
-short_description: check it the named schema exists in a mysql.
-description: ''
+short_description: secure a mariadb installation.
+description:
+    - Removes anonymous users, remote root accounts and the test database over one connection.
 """
 
 EXAMPLES = """
-- name: ensure, table_schema is present
-  icinga2_ido_version:
-    dba_host: ::1
-    dba_user: root
-    dba_password: password
+- name: secure database
+  mariadb_secure:
+    dba_root_username: root
+    dba_root_password: password
+    dba_socket: /run/mysqld/mysqld.sock
+    disallow_anonymous_users: true
+    disallow_test_database: true
+    disallow_remote_root_login: true
+"""
+
+RETURN = """
+ansible_facts:
+  description: the findings of the read-only pre-check as C(mariadb_secure)
+  returned: success
+  type: dict
+  sample:
+    mariadb_secure:
+      anonymous_users: 0
+      remote_root_accounts: 0
+      test_database: false
+queries:
+  description: all executed statements
+  returned: always
+  type: list
 """
 
 # ---------------------------------------------------------------------------------------
@@ -53,6 +72,8 @@ class MariaDBSecure(object):
         self.dba_root_password = module.params.get("dba_root_password")
         self.dba_socket = module.params.get("dba_socket")
         self.mycnf_file = module.params.get("mycnf_file")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
 
         self.db_connect_timeout = 30
 
@@ -60,152 +81,172 @@ class MariaDBSecure(object):
         """
           runner
         """
-        # mysqladmin_binary = self.module.get_bin_path("mysqladmin", False)
-        # mysql_binary = self.module.get_bin_path("mysql", False)
-        #
-        # args = [mysqladmin_binary]
-        # args.append("--user")
-        # args.append("root")
-        # args.append("status")
-        #
-        # rc, out, err = self._exec(args)
-        res = dict(
-            changed=False,
-            msg="all fine.",
-        )
-
         self.cursor, self.conn, error, message = self._mysql_connect()
 
-        if not error:
-
-            if self.disallow_remote_root_login:
-                state, error, error_message = self._remove_anonymous_users()
-
-                self.module.log(msg=f" - disallow remote root login: {state}")
-
-                if error:
-                    return dict(
-                        failed=True,
-                        msg=error_message
-                    )
-
-            if self.disallow_anonymous_users:
-                state, error, error_message = self._remove_remote_root_login()
-
-                self.module.log(msg=f" - disallow anonymous users: {state}")
+        if error:
+            return dict(
+                failed=True,
+                msg=message
+            )
 
-                if error:
-                    return dict(
-                        failed=True,
-                        msg=error_message
-                    )
+        try:
+            findings = self._pre_check()
+        except Exception as e:
+            self.conn.close()
 
-            if self.disallow_test_database:
-                state, error, error_message = self._remove_test_database()
+            return dict(
+                failed=True,
+                msg=f"Cannot execute SQL: {to_native(e)}"
+            )
 
-                self.module.log(msg=f" - remove test database: {state}")
+        facts = dict(
+            ansible_facts=dict(
+                mariadb_secure=findings
+            )
+        )
 
-                if error:
-                    return dict(
-                        failed=True,
-                        msg=error_message
-                    )
-        else:
-            res = dict(
-                changed=False,
-                msg=message
+        changed = False
+        queries = []
 
+        steps = [
+            (
+                self.disallow_anonymous_users and findings.get("anonymous_users") > 0,
+                "remove anonymous users",
+                self._remove_anonymous_users
+            ),
+            (
+                self.disallow_remote_root_login and findings.get("remote_root_accounts") > 0,
+                "disallow remote root login",
+                self._remove_remote_root_login
+            ),
+            (
+                self.disallow_test_database and findings.get("test_database"),
+                "remove test database",
+                self._remove_test_database
+            ),
+        ]
+
+        # fast path: the server is already hardened
+        if not any(enabled for enabled, _, _ in steps) or self.module.check_mode:
+            self.conn.close()
+
+            return dict(
+                changed=any(enabled for enabled, _, _ in steps),
+                msg="all fine.",
+                queries=queries,
+                **facts
             )
 
-        return res
-
-    def _remove_anonymous_users(self):
-        """
-        """
-        cursor, conn, error, message = self._mysql_connect()
+        try:
+            for enabled, description, step in steps:
+                if not enabled:
+                    continue
 
-        if error:
-            return (False, error, message)
+                step_queries = step()
 
-        query = "delete from mysql.user where user = '{0}' and host not in ('localhost', '127.0.0.1', '::1')"
-        query = query.format(self.dba_root_username)
+                self.module.log(msg=f" - {description}: {len(step_queries) > 0}")
 
-        # self.module.log(msg="  query : '{}'".format(query))
+                if step_queries:
+                    changed = True
+                    queries += step_queries
 
-        try:
-            cursor.execute(query)
-            cursor.fetchone()
-            cursor.close()
+            if changed:
+                self.conn.commit()
 
         except Exception as e:
-            conn.rollback()
-            self.module.fail_json(msg="Cannot execute SQL '%s' : %s" % (query, to_native(e)))
+            self.conn.rollback()
+            self.conn.close()
+
+            return dict(
+                failed=True,
+                changed=changed,
+                msg=f"Cannot execute SQL: {to_native(e)}",
+                queries=queries,
+                **facts
+            )
 
-        return (True, False, None)
+        self.conn.close()
 
-    def _remove_remote_root_login(self):
+        return dict(
+            changed=changed,
+            msg="database secured." if changed else "all fine.",
+            queries=queries,
+            **facts
+        )
+
+    def _pre_check(self):
         """
+          read-only check of everything the module would remove, with one query
+        """
+        query = """
+            SELECT
+              (SELECT COUNT(*) FROM mysql.user WHERE User = '') AS anonymous_users,
+              (SELECT COUNT(*) FROM mysql.user
+                WHERE User = %s AND Host NOT IN ('localhost', '127.0.0.1', '::1')) AS remote_root_accounts,
+              (SELECT COUNT(*) FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = 'test') +
+              (SELECT COUNT(*) FROM mysql.db WHERE Db = 'test' OR Db = 'test\\\\_%%') AS test_database
         """
-        results = None
-
-        cursor, conn, error, message = self._mysql_connect()
-
-        if error:
-            return (False, error, message)
 
-        query = "select host, user, password from mysql.user where user = ''"
+        self.cursor.execute(query, (self.dba_root_username or "root",))
+        anonymous_users, remote_root_accounts, test_database = self.cursor.fetchone()
 
-        # self.module.log(msg="  query : '{}'".format(query))
+        return dict(
+            anonymous_users=int(anonymous_users),
+            remote_root_accounts=int(remote_root_accounts),
+            test_database=int(test_database) > 0,
+        )
 
-        try:
-            cursor.execute(query)
-            results = cursor.fetchall()
+    def _drop_accounts(self, query, args=None):
+        """
+          drop all accounts of the query result with a single DROP USER
+        """
+        self.cursor.execute(query, args)
+        accounts = self.cursor.fetchall()
 
-        except Exception as e:
-            self.module.fail_json(msg="Cannot execute SQL '%s' : %s" % (query, to_native(e)))
+        if not accounts:
+            return []
 
-        queries = []
-        if results:
-            q = "delete from mysql.user where user = '' and host = '{}'"
-            for x in results:
-                queries.append(q.format(x[0]))
+        names = ", ".join(["%s@%s"] * len(accounts))
+        args = [x for account in accounts for x in account]
 
-        for q in queries:
-            # self.module.log(msg="  query : {}".format(q))
-            try:
-                cursor.execute(q)
+        statement = f"DROP USER {names}"
+        self.cursor.execute(statement, args)
 
-            except Exception as e:
-                conn.rollback()
-                self.module.fail_json(msg="Cannot execute SQL '%s' : %s" % (q, to_native(e)))
+        return [statement]
 
-        conn.commit()
-        conn.close()
+    def _remove_anonymous_users(self):
+        """
+        """
+        return self._drop_accounts("SELECT User, Host FROM mysql.user WHERE User = ''")
 
-        return (True, False, None)
+    def _remove_remote_root_login(self):
+        """
+        """
+        return self._drop_accounts(
+            "SELECT User, Host FROM mysql.user WHERE User = %s AND Host NOT IN ('localhost', '127.0.0.1', '::1')",
+            (self.dba_root_username or "root",)
+        )
 
     def _remove_test_database(self):
         """
+          the test database and the default grants on 'test' and 'test_%'
         """
-        cursor, conn, error, message = self._mysql_connect()
+        queries = []
 
-        if error:
-            return (False, error, message)
+        self.cursor.execute("SELECT SCHEMA_NAME FROM information_schema.SCHEMATA WHERE SCHEMA_NAME = 'test'")
 
-        query = "drop database if exists test"
+        if self.cursor.fetchall():
+            queries.append("DROP DATABASE IF EXISTS test")
+            self.cursor.execute(queries[-1])
 
-        # self.module.log(msg="  query : '{}'".format(query))
+        query = "DELETE FROM mysql.db WHERE Db = 'test' OR Db = 'test\\_%'"
 
-        try:
-            cursor.execute(query)
-            conn.commit()
-            conn.close()
+        if self.cursor.execute(query):
+            queries.append(query)
+            queries.append("FLUSH PRIVILEGES")
+            self.cursor.execute(queries[-1])
 
-        except Exception as e:
-            conn.rollback()
-            self.module.fail_json(msg="Cannot execute SQL '%s' : %s" % (query, to_native(e)))
-
-        return (True, False, None)
+        return queries
 
     def _exec(self, commands):
         """
@@ -227,43 +268,15 @@ class MariaDBSecure(object):
                 error
                 message
         """
-        config = {}
-
-        config_file = self.mycnf_file
-
-        if config_file and os.path.exists(config_file):
-            config['read_default_file'] = config_file
-
-        # If dba_user or dba_password are given, they should override the
-        # config file
-        if self.dba_root_username is not None:
-            config['user'] = self.dba_root_username
-
-        if self.dba_root_password is not None:
-            config['passwd'] = self.dba_root_password
-
-        if self.dba_socket is not None and os.path.exists(self.dba_socket):
-            config['unix_socket'] = self.dba_socket
-
-        # self.module.log(msg=f"config : {config}")
-
-        if mysql_driver is None:
-            self.module.fail_json(msg=mysql_driver_fail_msg)
-
-        try:
-            db_connection = mysql_driver.connect(**config)
-
-        except Exception as e:
-            message = "unable to connect to database. "
-            message += "check login_host, login_user and login_password are correct "
-            message += f"or {config_file} has the credentials. "
-            message += f"Exception message: {to_native(e)}"
-
-            self.module.log(msg=message)
-
-            return (None, None, True, message)
-
-        return (db_connection.cursor(), db_connection, False, "successful connected")
+        return mariadb_connect(
+            self.module,
+            login_user=self.dba_root_username,
+            login_password=self.dba_root_password,
+            login_unix_socket=self.dba_socket,
+            config_file=self.mycnf_file,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
 
     def _parse_from_mysql_config_file(self, cnf):
         cp = configparser.ConfigParser()
@@ -306,10 +319,11 @@ def main():
             default="/root/.my.cnf"
         ),
     )
+    specs.update(broker_argument_spec())
 
     module = AnsibleModule(
         argument_spec=specs,
-        supports_check_mode=False,
+        supports_check_mode=True,
     )
 
     # module.log(msg="-------------------------------------------------------------")
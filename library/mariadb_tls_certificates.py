@@ -9,10 +9,12 @@ import shutil
 import os
 import grp
 import pwd
+import json
 import hashlib
 
 # from ansible.module_utils import distro
 from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mariadb_file import copy_file_atomic, ensure_ownership, write_file_atomic
 
 __metaclass__ = type
 
@@ -22,6 +24,9 @@ ANSIBLE_METADATA = {
     'supported_by': 'community'
 }
 
+MANIFEST_FILE = ".mariadb_tls_manifest.json"
+CHUNK_SIZE = 64 * 1024
+
 
 class MariadbDataDirectories(object):
     """
@@ -158,30 +163,88 @@ class MariadbDataDirectories(object):
         changed = False
         failed = False
 
+        uid = pwd.getpwnam(self.owner).pw_uid
+        gid = grp.getgrnam(self.group).gr_gid
+
+        if ensure_ownership(self.destination, uid=uid, gid=gid):
+            changed = True
+
+        manifest = self.load_manifest()
+        new_manifest = {}
+
         for f in self.ssl_files:
             differ = True
             s = f
             d = os.path.join(self.destination, os.path.basename(f))
+            entry = manifest.get(os.path.basename(f))
 
             if os.path.isfile(d):
-                differ = self.verify(s, d)
+                if self.stat_unchanged(entry, s, d):
+                    differ = False
+                else:
+                    differ = self.verify(s, d)
 
             # self.module.log(msg=f" - {s} -> {d}, differ: {differ}")
 
             if differ:
-                shutil.copyfile(s, d)
-                os.chmod(d, 0o0440)
+                copy_file_atomic(s, d, mode=0o0440, uid=uid, gid=gid)
+                changed = True
+            elif ensure_ownership(d, uid=uid, gid=gid, mode=0o0440):
                 changed = True
 
-        for root, dirs, files in os.walk(self.destination):
-            shutil.chown(root, self.owner, self.group)
-            for item in dirs:
-                shutil.chown(os.path.join(root, item), self.owner, self.group)
-            for item in files:
-                shutil.chown(os.path.join(root, item), self.owner, self.group)
+            if differ or not self.stat_unchanged(entry, s, d):
+                entry = self.manifest_entry(s, d)
+
+            new_manifest[os.path.basename(f)] = entry
+
+        self.save_manifest(new_manifest)
 
         return changed, failed
 
+    def load_manifest(self):
+        """
+          size and mtime of the source and destination files of the last run
+        """
+        manifest_file = os.path.join(self.destination, MANIFEST_FILE)
+
+        try:
+            with open(manifest_file, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_manifest(self, manifest):
+        """
+        """
+        manifest_file = os.path.join(self.destination, MANIFEST_FILE)
+
+        try:
+            write_file_atomic(manifest_file, json.dumps(manifest, indent=2, sort_keys=True), mode=0o0600)
+        except OSError as e:
+            self.module.log(msg=f"WARNING: can't write manifest {manifest_file}: {e}")
+
+    def manifest_entry(self, source_file, destination_file):
+        """
+        """
+        return dict(
+            source=self.__stat(source_file),
+            destination=self.__stat(destination_file),
+            checksum=self.__create_checksum_file(destination_file),
+        )
+
+    def stat_unchanged(self, entry, source_file, destination_file):
+        """
+          fast path: both files are unchanged since the last verified run,
+          no file content has to be read.
+        """
+        if not entry:
+            return False
+
+        source_unchanged = entry.get("source") == self.__stat(source_file)
+        destination_unchanged = entry.get("destination") == self.__stat(destination_file)
+
+        return source_unchanged and destination_unchanged
+
     def verify(self, source_file, destination_file):
         """
         """
@@ -205,16 +268,24 @@ class MariadbDataDirectories(object):
     def __create_checksum_file(self, filename):
         """
         """
-        with open(filename, "r") as d:
-            _data = d.read().rstrip('\n')
-            return self.__checksum(_data)
+        _hash = hashlib.sha256()
+
+        with open(filename, "rb") as d:
+            for chunk in iter(lambda: d.read(CHUNK_SIZE), b""):
+                _hash.update(chunk)
+
+        return _hash.hexdigest()
 
-    def __checksum(self, plaintext):
+    def __stat(self, filename):
         """
         """
-        _bytes = plaintext.encode('utf-8')
-        _hash = hashlib.sha256(_bytes)
-        return _hash.hexdigest()
+        _stat = os.stat(filename)
+
+        return dict(
+            path=os.path.realpath(filename),
+            size=_stat.st_size,
+            mtime=_stat.st_mtime_ns,
+        )
 
 
 def main():
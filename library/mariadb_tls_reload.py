@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import os
+import datetime
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_capabilities import MariadbCapabilities, version_tuple
+from ansible.module_utils.mariadb_connection import mariadb_connect, server_stopped
+
+try:
+    from cryptography import x509
+    HAS_CRYPTOGRAPHY = True
+except ImportError:
+    HAS_CRYPTOGRAPHY = False
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_tls_reload.py
+author:
+    - 'Bodo Schulz'
+short_description: activate changed TLS certificates of a running mariadb server without restart.
+description:
+    - Executes C(FLUSH SSL) (MariaDB 10.4 and newer) and verifies with C(Ssl_server_not_after)
+      that the server uses the certificate I(ssl_cert).
+    - Older servers return C(restart_required).
+    - A server which is not running (nothing listens on I(login_unix_socket) and the process of I(pid_file) doesn't run) is skipped,
+      it loads the certificates at the next start. Any other connection error returns C(restart_required).
+    - The expiry date of the certificate is read with the python cryptography module or the openssl binary.
+options:
+  ssl_cert:
+    description:
+      - The server certificate (C(ssl-cert)) as configured for the server.
+    type: path
+    required: true
+  cache_directory:
+    description:
+      - Directory in which the probed server capabilities are cached.
+    type: path
+    required: false
+  pid_file:
+    description:
+      - Pid file of the server. A server with a running process isn't treated as stopped, even if the socket doesn't answer.
+    type: path
+    required: false
+"""
+
+EXAMPLES = """
+- name: reload TLS certificates
+  mariadb_tls_reload:
+    ssl_cert: "{{ mariadb_config_mysqld['ssl-cert'] }}"
+    login_unix_socket: "{{ mariadb_socket }}"
+    config_file: /root/.my.cnf
+    cache_directory: "{{ mariadb_config_dir }}"
+    pid_file: "{{ mariadb_pid_file }}"
+  register: _tls_reload
+"""
+
+RETURN = """
+not_after:
+  description: the expiry date of the certificate used by the server
+  returned: success
+  type: str
+  sample: "2030-03-04 12:00:00"
+restart_required:
+  description: the certificates can only be activated by a restart
+  returned: always
+  type: bool
+"""
+
+# ---------------------------------------------------------------------------------------
+
+
+class MariadbTlsReload(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.ssl_cert = module.params.get("ssl_cert")
+        self.cache_directory = module.params.get("cache_directory")
+        self.pid_file = module.params.get("pid_file")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+
+    def run(self):
+        """
+        """
+        if not os.path.isfile(self.ssl_cert):
+            return dict(
+                failed=True,
+                restart_required=False,
+                msg=f"certificate {self.ssl_cert} does not exist."
+            )
+
+        expected, error = self.certificate_not_after()
+
+        if error:
+            return dict(
+                failed=True,
+                restart_required=False,
+                msg=error
+            )
+
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+        )
+
+        if error:
+            if server_stopped(self.login_unix_socket, self.pid_file):
+                # a stopped server loads the new certificates at the next start
+                return dict(
+                    changed=False,
+                    restart_required=False,
+                    msg=f"server not running, nothing to reload. ({message})"
+                )
+
+            # e.g. wrong credentials, the certificates must not stay inactive
+            return dict(
+                changed=False,
+                restart_required=True,
+                msg=f"can't connect to the server, a restart is required to load the certificates. ({message})"
+            )
+
+        try:
+            capabilities = MariadbCapabilities(
+                self.module,
+                cache_directory=self.cache_directory,
+                socket=self.login_unix_socket
+            ).probe(cursor)
+
+            # FLUSH SSL is available since 10.4
+            if version_tuple(capabilities.get("version")) < (10, 4, 0):
+                return dict(
+                    changed=False,
+                    restart_required=True,
+                    msg=f"MariaDB {capabilities.get('version')} can't reload TLS certificates, a restart is required."
+                )
+
+            # FLUSH SSL only re-reads the files of the running configuration
+            cursor.execute("SELECT @@GLOBAL.ssl_cert")
+            configured = cursor.fetchone()[0]
+
+            if not capabilities.get("tls") or not configured or os.path.realpath(configured) != os.path.realpath(self.ssl_cert):
+                return dict(
+                    changed=False,
+                    restart_required=True,
+                    msg="the running server uses another TLS configuration, a restart is required."
+                )
+
+            if self.module.check_mode:
+                return dict(
+                    changed=True,
+                    restart_required=False,
+                    msg="TLS certificates would be reloaded."
+                )
+
+            cursor.execute("FLUSH SSL")
+
+            active = self.server_not_after(cursor)
+
+        except Exception as e:
+            return dict(
+                failed=True,
+                restart_required=False,
+                msg=f"can't reload TLS certificates: {to_native(e)}"
+            )
+
+        finally:
+            conn.close()
+
+        if active != expected:
+            return dict(
+                failed=True,
+                changed=True,
+                restart_required=False,
+                msg=f"the server uses a certificate valid until {active}, expected {expected}."
+            )
+
+        return dict(
+            changed=True,
+            restart_required=False,
+            not_after=str(expected),
+            msg="TLS certificates reloaded."
+        )
+
+    def server_not_after(self, cursor):
+        """
+        """
+        cursor.execute("SHOW GLOBAL STATUS LIKE 'Ssl_server_not_after'")
+        row = cursor.fetchone()
+
+        if not row or not row[1]:
+            return None
+
+        return self.parse_openssl_date(row[1])
+
+    def certificate_not_after(self):
+        """
+          returns (datetime in UTC, error)
+        """
+        if HAS_CRYPTOGRAPHY:
+            try:
+                with open(self.ssl_cert, "rb") as f:
+                    certificate = x509.load_pem_x509_certificate(f.read())
+
+                not_after = getattr(certificate, "not_valid_after_utc", None)
+
+                if not_after is None:
+                    not_after = certificate.not_valid_after
+
+                return (not_after.replace(tzinfo=None), None)
+
+            except Exception as e:
+                return (None, f"can't read certificate {self.ssl_cert}: {to_native(e)}")
+
+        openssl_binary = self.module.get_bin_path("openssl", False)
+
+        if not openssl_binary:
+            return (None, "neither the python cryptography module nor the openssl binary is available.")
+
+        rc, out, err = self.module.run_command(
+            [openssl_binary, "x509", "-noout", "-enddate", "-in", self.ssl_cert],
+            environ_update=dict(LC_ALL="C")
+        )
+
+        if rc != 0 or "=" not in out:
+            return (None, f"can't read certificate {self.ssl_cert}: {err.strip()}")
+
+        return (self.parse_openssl_date(out.split("=", 1)[1]), None)
+
+    def parse_openssl_date(self, value):
+        """
+          'Mar  4 12:00:00 2030 GMT' -> datetime
+        """
+        return datetime.datetime.strptime(" ".join(value.split()), "%b %d %H:%M:%S %Y %Z")
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        ssl_cert=dict(
+            required=True,
+            type='path'
+        ),
+        cache_directory=dict(
+            required=False,
+            type='path'
+        ),
+        pid_file=dict(
+            required=False,
+            type='path'
+        ),
+    )
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbTlsReload(module)
+    result = client.run()
+
+    module.log(msg=f"= result: {result}")
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,482 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import os
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
+from ansible.module_utils.mariadb_config import server_variables, normalize_number, format_size
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_tuning_report.py
+author:
+    - 'Bodo Schulz'
+short_description: analyze a running mariadb server and recommend tuning settings.
+description:
+    - A native replacement for C(mysqltuner.pl) without network access and perl.
+    - Collects C(SHOW GLOBAL STATUS), the global variables, the table sizes of C(information_schema.TABLES)
+      and the top statements of C(performance_schema.events_statements_summary_by_digest) with a few bulk queries.
+    - Computes the usual ratios (buffer pool hit rate, temporary tables on disk, thread cache misses,
+      table cache hit rate, connection usage, ...) and returns recommendations, which can be merged
+      into C(mariadb_config_mysqld).
+    - The module never changes anything.
+options:
+  digests:
+    description:
+      - Number of statement digests (ordered by the total execution time), C(0) disables the digests.
+    type: int
+    default: 10
+  min_uptime:
+    description:
+      - Minimum uptime of the server (in seconds). A server which runs shorter only gets a hint
+        and no recommendations, the ratios are not representative.
+    type: int
+    default: 86400
+"""
+
+EXAMPLES = """
+- name: tuning report
+  mariadb_tuning_report:
+    digests: 10
+    login_unix_socket: "{{ mariadb_socket }}"
+    config_file: /root/.my.cnf
+  register: _mariadb_tuning_report
+
+- name: apply the recommendations
+  ansible.builtin.set_fact:
+    mariadb_config_mysqld: "{{ mariadb_config_mysqld | combine(_mariadb_tuning_report.mariadb_config_mysqld) }}"
+"""
+
+RETURN = """
+metrics:
+  description: computed ratios (in percent) and counters
+  returned: success
+  type: dict
+  sample:
+    uptime: 1209600
+    buffer_pool_hit_rate: 99.87
+    tmp_disk_tables_ratio: 31.2
+    thread_cache_miss_rate: 2.1
+    table_cache_hit_rate: 87.5
+    connections_usage: 42.0
+storage:
+  description: tables and sizes (in bytes) per storage engine
+  returned: success
+  type: list
+  sample:
+    - engine: InnoDB
+      tables: 120
+      data: 4294967296
+      index: 1073741824
+      free: 8388608
+digests:
+  description: the statements with the highest total execution time
+  returned: success
+  type: list
+recommendations:
+  description: recommended changes with the reason
+  returned: success
+  type: list
+  sample:
+    - variable: tmp_table_size
+      current: "16777216"
+      recommended: 32M
+      reason: "31.2% of the temporary tables were created on disk"
+mariadb_config_mysqld:
+  description: the recommended values as dictionary for mariadb_config_mysqld
+  returned: success
+  type: dict
+  sample:
+    tmp_table_size: 32M
+    max_heap_table_size: 32M
+hints:
+  description: hints without a concrete value
+  returned: success
+  type: list
+"""
+
+# ---------------------------------------------------------------------------------------
+
+SYSTEM_SCHEMAS = [
+    "mysql",
+    "information_schema",
+    "performance_schema",
+    "sys",
+]
+
+
+class MariadbTuningReport(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.digests = module.params.get("digests")
+        self.min_uptime = module.params.get("min_uptime")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
+
+        self.status = {}
+        self.variables = {}
+        self.recommendations = []
+        self.hints = []
+
+    def run(self):
+        """
+        """
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
+
+        if error:
+            return dict(
+                failed=True,
+                msg=message
+            )
+
+        try:
+            cursor.execute("SHOW GLOBAL STATUS")
+            self.status = {name.lower(): value for name, value in cursor.fetchall()}
+
+            self.variables = {name: x.get("value") for name, x in server_variables(cursor).items()}
+
+            storage = self.storage(cursor)
+            digests = self.statement_digests(cursor)
+
+        except Exception as e:
+            return dict(
+                failed=True,
+                msg=f"can't collect the server statistics: {to_native(e)}"
+            )
+
+        finally:
+            conn.close()
+
+        metrics = self.analyze(storage)
+
+        return dict(
+            changed=False,
+            metrics=metrics,
+            storage=storage,
+            digests=digests,
+            recommendations=self.recommendations,
+            mariadb_config_mysqld={x.get("variable"): x.get("recommended") for x in self.recommendations},
+            hints=self.hints,
+            msg=f"{len(self.recommendations)} recommendation(s), {len(self.hints)} hint(s)."
+        )
+
+    def storage(self, cursor):
+        """
+        """
+        schemas = ", ".join(["%s"] * len(SYSTEM_SCHEMAS))
+
+        cursor.execute(
+            "SELECT ENGINE, COUNT(*), SUM(DATA_LENGTH), SUM(INDEX_LENGTH), SUM(DATA_FREE) "
+            f"FROM information_schema.TABLES WHERE TABLE_SCHEMA NOT IN ({schemas}) AND ENGINE IS NOT NULL "
+            "GROUP BY ENGINE",
+            tuple(SYSTEM_SCHEMAS)
+        )
+
+        return [
+            dict(
+                engine=engine,
+                tables=int(tables or 0),
+                data=int(data or 0),
+                index=int(index or 0),
+                free=int(free or 0),
+            )
+            for engine, tables, data, index, free in cursor.fetchall()
+        ]
+
+    def statement_digests(self, cursor):
+        """
+          the top statements, if the performance schema is enabled
+        """
+        if not self.digests or self.variables.get("performance_schema") != "ON":
+            return []
+
+        cursor.execute(
+            "SELECT SCHEMA_NAME, DIGEST_TEXT, COUNT_STAR, SUM_TIMER_WAIT, SUM_ROWS_EXAMINED, SUM_ROWS_SENT, "
+            "SUM_NO_INDEX_USED, SUM_CREATED_TMP_DISK_TABLES "
+            "FROM performance_schema.events_statements_summary_by_digest "
+            "ORDER BY SUM_TIMER_WAIT DESC LIMIT %s",
+            (self.digests,)
+        )
+
+        return [
+            dict(
+                schema=schema,
+                digest=text,
+                count=int(count or 0),
+                # picoseconds
+                total_time=round(int(timer or 0) / 10 ** 12, 3),
+                rows_examined=int(examined or 0),
+                rows_sent=int(sent or 0),
+                no_index_used=int(no_index or 0),
+                tmp_disk_tables=int(tmp_disk or 0),
+            )
+            for schema, text, count, timer, examined, sent, no_index, tmp_disk in cursor.fetchall()
+        ]
+
+    def analyze(self, storage):
+        """
+        """
+        uptime = self.counter("uptime")
+
+        metrics = dict(
+            uptime=uptime,
+            questions=self.counter("questions"),
+            buffer_pool_hit_rate=self.buffer_pool(storage),
+            tmp_disk_tables_ratio=self.tmp_tables(),
+            thread_cache_miss_rate=self.thread_cache(),
+            table_cache_hit_rate=self.table_cache(storage),
+            connections_usage=self.connections(),
+            aborted_connections_ratio=self.percent(self.counter("aborted_connects"), self.counter("connections")),
+            slow_queries_ratio=self.percent(self.counter("slow_queries"), self.counter("questions")),
+            sort_merge_passes=self.counter("sort_merge_passes"),
+        )
+
+        self.innodb_log()
+
+        if metrics.get("slow_queries_ratio", 0) > 5:
+            self.hints.append(f"{metrics.get('slow_queries_ratio')}% of the queries are slow, see the statement digests.")
+
+        if metrics.get("aborted_connections_ratio", 0) > 5:
+            self.hints.append(f"{metrics.get('aborted_connections_ratio')}% of the connection attempts failed.")
+
+        # no advice from the ratios of a freshly (re)started server
+        if uptime < self.min_uptime:
+            self.recommendations = []
+            self.hints = [f"the server is running for {uptime} seconds only, the ratios are not representative."]
+
+        return metrics
+
+    def buffer_pool(self, storage):
+        """
+          hit rate of the InnoDB buffer pool and pool size vs. InnoDB data
+        """
+        requests = self.counter("innodb_buffer_pool_read_requests")
+        reads = self.counter("innodb_buffer_pool_reads")
+
+        hit_rate = 100.0 - self.percent(reads, requests) if requests else 100.0
+
+        innodb = [x for x in storage if (x.get("engine") or "").lower() == "innodb"]
+        innodb_size = sum([x.get("data") + x.get("index") for x in innodb])
+        pool_size = self.variable("innodb_buffer_pool_size")
+
+        if hit_rate < 99.0 and innodb_size > pool_size:
+            chunk_size = self.variable("innodb_buffer_pool_chunk_size") or 128 * 1024 * 1024
+            # never more than 75% of the memory of this host
+            memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+            limit = int(memory * 0.75) // chunk_size * chunk_size
+
+            recommended = min(limit, -(-innodb_size // chunk_size) * chunk_size)
+
+            if recommended > pool_size:
+                self.recommend(
+                    "innodb_buffer_pool_size",
+                    format_size(recommended),
+                    f"buffer pool hit rate {hit_rate:.2f}%, the InnoDB data and indexes need {format_size(innodb_size)}"
+                )
+            else:
+                self.hints.append(f"buffer pool hit rate {hit_rate:.2f}%, the InnoDB data and indexes don't fit in the memory.")
+
+        return round(hit_rate, 2)
+
+    def tmp_tables(self):
+        """
+        """
+        created = self.counter("created_tmp_tables")
+        on_disk = self.counter("created_tmp_disk_tables")
+
+        ratio = self.percent(on_disk, created)
+
+        if ratio > 25 and created > 100:
+            # the smaller of both limits is used for in-memory temporary tables
+            size = min(self.variable("tmp_table_size"), self.variable("max_heap_table_size"))
+            recommended = format_size(min(size * 2, 256 * 1024 * 1024))
+
+            if normalize_number(recommended) > size:
+                reason = f"{ratio}% of the temporary tables were created on disk"
+                self.recommend("tmp_table_size", recommended, reason)
+                self.recommend("max_heap_table_size", recommended, reason)
+            else:
+                self.hints.append(f"{ratio}% of the temporary tables were created on disk, check queries with BLOB/TEXT columns.")
+
+        return ratio
+
+    def thread_cache(self):
+        """
+        """
+        connections = self.counter("connections")
+        created = self.counter("threads_created")
+
+        miss_rate = self.percent(created, connections)
+        cache_size = self.variable("thread_cache_size")
+
+        if miss_rate > 10 and connections > 100:
+            recommended = min(1000, max(cache_size * 2, self.counter("max_used_connections"), 16))
+
+            if recommended > cache_size:
+                self.recommend(
+                    "thread_cache_size",
+                    recommended,
+                    f"{miss_rate}% of the connections created a new thread"
+                )
+
+        return miss_rate
+
+    def table_cache(self, storage):
+        """
+        """
+        hits = self.counter("table_open_cache_hits")
+        misses = self.counter("table_open_cache_misses")
+
+        if hits + misses > 0:
+            hit_rate = 100.0 - self.percent(misses, hits + misses)
+        else:
+            # servers without the table cache counters
+            hit_rate = self.percent(self.counter("open_tables"), self.counter("opened_tables")) if self.counter("opened_tables") else 100.0
+
+        tables = sum([x.get("tables") for x in storage]) + 400
+        open_cache = self.variable("table_open_cache")
+        definition_cache = self.variable("table_definition_cache")
+
+        if hit_rate < 90 and self.counter("opened_tables") > open_cache:
+            self.recommend(
+                "table_open_cache",
+                min(65536, max(open_cache * 2, tables)),
+                f"table cache hit rate {hit_rate:.2f}%, {self.counter('opened_tables')} tables were opened"
+            )
+
+        if tables > definition_cache:
+            self.recommend(
+                "table_definition_cache",
+                min(65536, tables),
+                f"{tables - 400} tables do not fit in the table definition cache"
+            )
+
+        return round(hit_rate, 2)
+
+    def connections(self):
+        """
+        """
+        max_connections = self.variable("max_connections")
+        max_used = self.counter("max_used_connections")
+
+        usage = self.percent(max_used, max_connections)
+
+        if usage > 85:
+            self.recommend(
+                "max_connections",
+                int(max_connections * 1.25),
+                f"{max_used} of {max_connections} connections were used"
+            )
+
+        return usage
+
+    def innodb_log(self):
+        """
+        """
+        waits = self.counter("innodb_log_waits")
+        buffer_size = self.variable("innodb_log_buffer_size")
+
+        if waits > 0 and buffer_size:
+            recommended = format_size(min(buffer_size * 2, 256 * 1024 * 1024))
+
+            if normalize_number(recommended) > buffer_size:
+                self.recommend("innodb_log_buffer_size", recommended, f"{waits} waits for the InnoDB log buffer")
+            else:
+                self.hints.append(f"{waits} waits for the InnoDB log buffer, check large transactions.")
+
+    def recommend(self, variable, recommended, reason):
+        """
+        """
+        self.recommendations.append(dict(
+            variable=variable,
+            current=self.variables.get(variable),
+            recommended=recommended,
+            reason=reason
+        ))
+
+    def counter(self, name):
+        """
+        """
+        return int(normalize_number(self.status.get(name) or 0) or 0)
+
+    def variable(self, name):
+        """
+        """
+        return int(normalize_number(self.variables.get(name) or 0) or 0)
+
+    def percent(self, value, total):
+        """
+        """
+        if not total:
+            return 0.0
+
+        return round(100.0 * value / total, 2)
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        digests=dict(
+            required=False,
+            type='int',
+            default=10
+        ),
+        min_uptime=dict(
+            required=False,
+            type='int',
+            default=86400
+        ),
+    )
+    specs.update(broker_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbTuningReport(module)
+    result = client.run()
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,547 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+import re
+import hashlib
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.basic import AnsibleModule
+from ansible.module_utils.mysql import mysql_common_argument_spec
+from ansible.module_utils.mariadb_connection import mariadb_connect, broker_argument_spec
+
+# ---------------------------------------------------------------------------------------
+
+DOCUMENTATION = """
+---
+module: mariadb_users.py
+author:
+    - 'Bodo Schulz'
+short_description: create, change or remove a list of mariadb users with a single call.
+description:
+    - Reads all accounts and grants of the server in one pass, compares them in memory with
+      the complete list of desired users and only executes the needed
+      C(CREATE USER), C(ALTER USER), C(GRANT), C(REVOKE) and C(DROP USER) statements.
+    - Routine privileges are supported with the objects C(PROCEDURE db.name) and C(FUNCTION db.name).
+    - Column privileges are not supported, they are neither read nor changed.
+options:
+  users:
+    description:
+      - List of users with the same keys as C(mariadb_users).
+      - C(name) (required), C(password), C(host) (default C(localhost)),
+        C(priv) (default C(*.*:USAGE), e.g. C(db.*:SELECT/PROCEDURE db.proc:EXECUTE)), C(state) (default C(present)),
+        C(append_privs) (default C(false)), C(encrypted) (default C(true)),
+        C(update_password) (default C(always)).
+    type: list
+    elements: dict
+    required: true
+"""
+
+EXAMPLES = """
+- name: create or remove mariadb users
+  mariadb_users:
+    users: "{{ mariadb_users }}"
+    login_user: "{{ _mariadb_root_system_user.username }}"
+    login_password: "{{ _mariadb_root_system_user.password }}"
+    login_unix_socket: "{{ mariadb_socket | default(omit) }}"
+    config_file: "{{ _mariadb_root_system_user.home | default('/root') }}/.my.cnf"
+"""
+
+RETURN = """
+users:
+  description: changed report for every user
+  returned: always
+  type: list
+  sample:
+    - name: molecule
+      host: "%"
+      state: present
+      changed: true
+      queries:
+        - "CREATE USER %s@%s IDENTIFIED BY %s"
+        - "GRANT ALL PRIVILEGES ON `molecule`.* TO %s@%s"
+queries:
+  description: all executed statements (without passwords)
+  returned: always
+  type: list
+"""
+
+# ---------------------------------------------------------------------------------------
+
+# privileges which are granted by 'ALL PRIVILEGES' at every supported version
+ALL_PRIVILEGES_DATABASE = {
+    "SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "DROP", "REFERENCES",
+    "INDEX", "ALTER", "CREATE TEMPORARY TABLES", "LOCK TABLES", "EXECUTE",
+    "CREATE VIEW", "SHOW VIEW", "CREATE ROUTINE", "ALTER ROUTINE", "EVENT", "TRIGGER",
+}
+
+ALL_PRIVILEGES_TABLE = {
+    "SELECT", "INSERT", "UPDATE", "DELETE", "CREATE", "DROP", "REFERENCES",
+    "INDEX", "ALTER", "CREATE VIEW", "SHOW VIEW", "TRIGGER",
+}
+
+ALL_PRIVILEGES_ROUTINE = {
+    "EXECUTE", "ALTER ROUTINE",
+}
+
+ALL_PRIVILEGES_GLOBAL = ALL_PRIVILEGES_DATABASE | {
+    "RELOAD", "SHUTDOWN", "PROCESS", "FILE", "SHOW DATABASES", "SUPER",
+    "REPLICATION SLAVE", "CREATE USER", "CREATE TABLESPACE",
+}
+
+# the same privilege with different names, compared by the first one
+# (e.g. 'REPLICATION CLIENT' is called 'BINLOG MONITOR' since 10.5.2)
+PRIVILEGE_ALIASES = {
+    "ALL": "ALL PRIVILEGES",
+    "REPLICATION CLIENT": "BINLOG MONITOR",
+    "REPLICATION REPLICA": "REPLICATION SLAVE",
+}
+
+# names for GRANT / REVOKE before 10.5.2
+STATEMENT_NAMES = {
+    "BINLOG MONITOR": "REPLICATION CLIENT",
+}
+
+VALID_PRIVILEGE = re.compile(r"^[A-Z][A-Z ]*$")
+ROUTINE_OBJECT = re.compile(r"^(?P<type>PROCEDURE|FUNCTION)\s+(?P<name>.+)$", re.IGNORECASE)
+
+
+def mysql_native_password(password):
+    """
+      the same hash as PASSWORD() for mysql_native_password
+    """
+    stage1 = hashlib.sha1(password.encode("utf-8")).digest()
+    return "*" + hashlib.sha1(stage1).hexdigest().upper()
+
+
+def privilege_list(privileges, names=None):
+    """
+    """
+    names = names or {}
+    return ", ".join(sorted(names.get(x, x) for x in privileges))
+
+
+def quote_object(name):
+    """
+      'db.*' -> '`db`.*'
+      'procedure db.name' -> 'PROCEDURE `db`.`name`'
+    """
+    match = ROUTINE_OBJECT.match(name.strip())
+
+    if match:
+        return "{} {}".format(match.group("type").upper(), quote_object(match.group("name")))
+
+    database, table = name.split(".", 1)
+
+    database = database.strip("`")
+    table = table.strip("`")
+
+    if database != "*":
+        database = "`{}`".format(database.replace("`", "``"))
+    if table != "*":
+        table = "`{}`".format(table.replace("`", "``"))
+
+    return f"{database}.{table}"
+
+
+class MariadbUsers(object):
+    """
+    """
+    module = None
+
+    def __init__(self, module):
+        """
+          Initialize all needed Variables
+        """
+        self.module = module
+
+        self.users = module.params.get("users")
+        self.login_username = module.params.get("login_user")
+        self.login_password = module.params.get("login_password")
+        self.login_unix_socket = module.params.get("login_unix_socket")
+        self.login_host = module.params.get("login_host")
+        self.login_port = module.params.get("login_port")
+        self.config_file = module.params.get("config_file")
+        self.connect_timeout = module.params.get("connect_timeout")
+        self.use_broker = module.params.get("use_broker")
+        self.broker_ttl = module.params.get("broker_ttl")
+
+        self.executed_queries = []
+        self.statement_names = {}
+
+    def run(self):
+        """
+        """
+        try:
+            desired = [self._normalize_user(x) for x in self.users]
+        except ValueError as e:
+            return dict(
+                failed=True,
+                msg=to_native(e)
+            )
+
+        cursor, conn, error, message = mariadb_connect(
+            self.module,
+            login_user=self.login_username,
+            login_password=self.login_password,
+            login_unix_socket=self.login_unix_socket,
+            login_host=self.login_host,
+            login_port=self.login_port,
+            config_file=self.config_file,
+            connect_timeout=self.connect_timeout,
+            use_broker=self.use_broker,
+            broker_ttl=self.broker_ttl
+        )
+
+        if error:
+            return dict(
+                failed=True,
+                msg=message
+            )
+
+        if self._server_version(cursor) < (10, 5, 2):
+            self.statement_names = STATEMENT_NAMES
+
+        accounts = self._read_accounts(cursor)
+        grants = self._read_grants(cursor)
+
+        # build the complete plan before anything is changed
+        plan = []
+        for user in desired:
+            key = (user.get("name"), user.get("host"))
+            statements = self._diff_user(user, accounts.get(key), grants.get(key, {}))
+            plan.append((user, statements))
+
+        report = []
+        failed = False
+        msg = "all users are up to date."
+
+        for user, statements in plan:
+            entry = dict(
+                name=user.get("name"),
+                host=user.get("host"),
+                state=user.get("state"),
+                changed=len(statements) > 0,
+                queries=[x[0] for x in statements],
+            )
+            report.append(entry)
+
+            if self.module.check_mode:
+                continue
+
+            if failed:
+                # nothing was applied after the first error
+                entry["changed"] = False
+                continue
+
+            for query, args in statements:
+                try:
+                    self.executed_queries.append(query)
+                    cursor.execute(query, args)
+                except Exception as e:
+                    failed = True
+                    entry["failed"] = True
+                    msg = f"user '{user.get('name')}'@'{user.get('host')}': {query} failed: {to_native(e)}"
+                    break
+
+        if not failed and not self.module.check_mode:
+            try:
+                conn.commit()
+            except Exception as e:
+                failed = True
+                msg = f"commit failed: {to_native(e)}"
+
+        changed = any(x.get("changed") for x in report)
+
+        if changed and not failed:
+            msg = f"{len([x for x in report if x.get('changed')])} user(s) changed."
+
+        conn.close()
+
+        return dict(
+            changed=changed,
+            failed=failed,
+            msg=msg,
+            users=report,
+            queries=self.executed_queries
+        )
+
+    def _normalize_user(self, data):
+        """
+        """
+        name = data.get("name")
+
+        return dict(
+            name=name,
+            host=data.get("host") or "localhost",
+            password=data.get("password"),
+            encrypted=data.get("encrypted"),
+            state=data.get("state"),
+            append_privs=data.get("append_privs"),
+            update_password=data.get("update_password"),
+            privileges=self._parse_privileges(name, data.get("priv")),
+        )
+
+    def _parse_privileges(self, name, priv):
+        """
+          '*.*:USAGE' / 'db.*:SELECT,INSERT/db2.*:ALL' / {'db.*': 'SELECT,INSERT'}
+            -> {'*.*': set(), '`db`.*': {'SELECT', 'INSERT'}}
+        """
+        result = {}
+
+        if not priv:
+            return result
+
+        if isinstance(priv, dict):
+            items = list(priv.items())
+        else:
+            items = []
+            for part in str(priv).split("/"):
+                if not part:
+                    continue
+                if ":" not in part:
+                    raise ValueError(f"invalid privileges string for user '{name}': '{part}'")
+                obj, privs = part.rsplit(":", 1)
+                items.append((obj, privs))
+
+        for obj, privs in items:
+            if "." not in obj:
+                raise ValueError(f"invalid privileges object for user '{name}': '{obj}'")
+
+            if isinstance(privs, (list, tuple)):
+                privs = ",".join(privs)
+
+            privileges = set()
+
+            for p in str(privs).split(","):
+                p = " ".join(p.upper().split())
+
+                if not p or p == "USAGE":
+                    continue
+
+                if not VALID_PRIVILEGE.match(p):
+                    raise ValueError(f"invalid or unsupported privilege for user '{name}': '{p}'")
+
+                privileges.add(PRIVILEGE_ALIASES.get(p, p))
+
+            result[quote_object(obj)] = privileges
+
+        return result
+
+    def _server_version(self, cursor):
+        """
+          '10.4.32-MariaDB-1:10.4.32+maria~deb11' -> (10, 4, 32)
+        """
+        cursor.execute("SELECT VERSION()")
+        version = cursor.fetchone()[0]
+
+        match = re.match(r"^(\d+)\.(\d+)\.(\d+)", str(version))
+
+        if not match:
+            return (0, 0, 0)
+
+        return tuple(int(x) for x in match.groups())
+
+    def _read_accounts(self, cursor):
+        """
+          {('name', 'host'): {'plugin': '...', 'hash': '...'}}
+        """
+        result = {}
+
+        cursor.execute("SELECT User, Host, plugin, authentication_string, Password FROM mysql.user")
+
+        for user, host, plugin, authentication_string, password in cursor.fetchall():
+            result[(user, host)] = dict(
+                plugin=plugin or "",
+                hash=password or authentication_string or "",
+            )
+
+        return result
+
+    def _read_grants(self, cursor):
+        """
+          {('name', 'host'): {'*.*': {'SELECT', 'GRANT'}, '`db`.*': {...}, 'PROCEDURE `db`.`name`': {...}}}
+        """
+        result = {}
+
+        def add(grantee, obj, privilege, grantable):
+            match = re.match(r"^'(?P<user>.*)'@'(?P<host>.*)'$", grantee)
+            if not match:
+                return
+
+            key = (match.group("user"), match.group("host"))
+            privileges = result.setdefault(key, {}).setdefault(obj, set())
+
+            if privilege != "USAGE":
+                privileges.add(PRIVILEGE_ALIASES.get(privilege, privilege))
+            if grantable == "YES":
+                privileges.add("GRANT")
+
+        cursor.execute("SELECT GRANTEE, PRIVILEGE_TYPE, IS_GRANTABLE FROM information_schema.USER_PRIVILEGES")
+        for grantee, privilege, grantable in cursor.fetchall():
+            add(grantee, "*.*", privilege, grantable)
+
+        cursor.execute("SELECT GRANTEE, TABLE_SCHEMA, PRIVILEGE_TYPE, IS_GRANTABLE FROM information_schema.SCHEMA_PRIVILEGES")
+        for grantee, schema, privilege, grantable in cursor.fetchall():
+            add(grantee, quote_object(f"{schema}.*"), privilege, grantable)
+
+        cursor.execute("SELECT GRANTEE, TABLE_SCHEMA, TABLE_NAME, PRIVILEGE_TYPE, IS_GRANTABLE FROM information_schema.TABLE_PRIVILEGES")
+        for grantee, schema, table, privilege, grantable in cursor.fetchall():
+            add(grantee, quote_object(f"{schema}.{table}"), privilege, grantable)
+
+        # routine privileges are not in information_schema
+        cursor.execute("SELECT User, Host, Db, Routine_name, Routine_type, Proc_priv FROM mysql.procs_priv")
+        for user, host, schema, routine, routine_type, proc_priv in cursor.fetchall():
+            obj = quote_object(f"{routine_type} {schema}.{routine}")
+
+            for privilege in [x.strip().upper() for x in str(proc_priv or "").split(",") if x.strip()]:
+                if privilege == "GRANT":
+                    add(f"'{user}'@'{host}'", obj, "USAGE", "YES")
+                else:
+                    add(f"'{user}'@'{host}'", obj, privilege, "NO")
+
+        return result
+
+    def _diff_user(self, user, account, current_grants):
+        """
+          returns a list of (query, args)
+        """
+        statements = []
+        name = user.get("name")
+        host = user.get("host")
+        password = user.get("password")
+
+        if user.get("state") == "absent":
+            if account is not None:
+                statements.append(("DROP USER %s@%s", (name, host)))
+            return statements
+
+        if account is None:
+            if password is None:
+                statements.append(("CREATE USER %s@%s", (name, host)))
+            elif user.get("encrypted"):
+                statements.append(("CREATE USER %s@%s IDENTIFIED BY PASSWORD %s", (name, host, password)))
+            else:
+                statements.append(("CREATE USER %s@%s IDENTIFIED BY %s", (name, host, password)))
+
+        elif password is not None and user.get("update_password") == "always":
+            if user.get("encrypted"):
+                wanted_hash = password
+            else:
+                wanted_hash = mysql_native_password(password)
+
+            native = account.get("plugin") in ("", "mysql_native_password")
+
+            if not native or account.get("hash") != wanted_hash:
+                if user.get("encrypted"):
+                    statements.append(("ALTER USER %s@%s IDENTIFIED BY PASSWORD %s", (name, host, password)))
+                else:
+                    statements.append(("ALTER USER %s@%s IDENTIFIED BY %s", (name, host, password)))
+
+        statements += self._diff_privileges(user, current_grants)
+
+        return statements
+
+    def _diff_privileges(self, user, current_grants):
+        """
+        """
+        statements = []
+        name = user.get("name")
+        host = user.get("host")
+        desired = user.get("privileges")
+
+        if not user.get("append_privs"):
+            for obj, current in current_grants.items():
+                if obj not in desired and current:
+                    statements.append((f"REVOKE ALL PRIVILEGES ON {obj} FROM %s@%s", (name, host)))
+                    if "GRANT" in current:
+                        statements.append((f"REVOKE GRANT OPTION ON {obj} FROM %s@%s", (name, host)))
+
+        for obj, wanted in desired.items():
+            current = current_grants.get(obj, set())
+
+            grant_option = "GRANT" in wanted
+            wanted = wanted - {"GRANT"}
+            current_grant_option = "GRANT" in current
+            current = current - {"GRANT"}
+
+            if "ALL PRIVILEGES" in wanted:
+                if obj == "*.*":
+                    all_privileges = ALL_PRIVILEGES_GLOBAL
+                elif ROUTINE_OBJECT.match(obj):
+                    all_privileges = ALL_PRIVILEGES_ROUTINE
+                elif obj.endswith(".*"):
+                    all_privileges = ALL_PRIVILEGES_DATABASE
+                else:
+                    all_privileges = ALL_PRIVILEGES_TABLE
+
+                if all_privileges.issubset(current):
+                    current = (current - all_privileges) | {"ALL PRIVILEGES"}
+
+            to_grant = wanted - current
+            to_revoke = set()
+
+            # 'ALL PRIVILEGES' includes every single privilege
+            if not user.get("append_privs") and "ALL PRIVILEGES" not in wanted:
+                to_revoke = current - wanted
+
+            if to_revoke:
+                if "ALL PRIVILEGES" in to_revoke:
+                    statements.append((f"REVOKE ALL PRIVILEGES ON {obj} FROM %s@%s", (name, host)))
+                    to_grant = wanted
+                else:
+                    statements.append((f"REVOKE {privilege_list(to_revoke, self.statement_names)} ON {obj} FROM %s@%s", (name, host)))
+
+            if current_grant_option and not grant_option and not user.get("append_privs"):
+                statements.append((f"REVOKE GRANT OPTION ON {obj} FROM %s@%s", (name, host)))
+
+            if to_grant or (grant_option and not current_grant_option):
+                privileges = privilege_list(to_grant, self.statement_names) or "USAGE"
+                query = f"GRANT {privileges} ON {obj} TO %s@%s"
+                if grant_option:
+                    query += " WITH GRANT OPTION"
+                statements.append((query, (name, host)))
+
+        return statements
+
+
+def main():
+    """
+    """
+    specs = mysql_common_argument_spec()
+    specs.update(
+        users=dict(
+            required=True,
+            type='list',
+            elements='dict',
+            options=dict(
+                name=dict(type='str', required=True),
+                password=dict(type='str', no_log=True),
+                host=dict(type='str', default='localhost'),
+                priv=dict(type='raw', default='*.*:USAGE'),
+                state=dict(type='str', default='present', choices=['present', 'absent']),
+                append_privs=dict(type='bool', default=False),
+                encrypted=dict(type='bool', default=True),
+                update_password=dict(type='str', default='always', choices=['always', 'on_create']),
+            )
+        ),
+    )
+    specs.update(broker_argument_spec())
+
+    module = AnsibleModule(
+        argument_spec=specs,
+        supports_check_mode=True,
+    )
+
+    client = MariadbUsers(module)
+    result = client.run()
+
+    module.exit_json(**result)
+
+
+# import module snippets
+if __name__ == '__main__':
+    main()
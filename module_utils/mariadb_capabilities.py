@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import json
+
+from ansible.module_utils.mariadb_file import write_file_atomic
+
+__metaclass__ = type
+
+# ---------------------------------------------------------------------------------------
+
+CACHE_FILE_NAME = ".mariadb_capabilities.json"
+
+SERVER_BINARIES = [
+    "/usr/sbin/mariadbd",
+    "/usr/bin/mariadbd",
+    "/usr/sbin/mysqld",
+    "/usr/bin/mysqld",
+]
+
+PROBE_VARIABLES = [
+    "version",
+    "version_comment",
+    "have_ssl",
+    "wsrep_on",
+]
+
+
+def version_tuple(version):
+    """
+      '10.11.6-MariaDB-0+deb12u1' -> (10, 11, 6)
+    """
+    if not version:
+        return (0, 0, 0)
+
+    result = re.match(r"^(?P<major>\d+)\.(?P<minor>\d+)(\.(?P<patch>\d+))?", str(version))
+
+    if not result:
+        return (0, 0, 0)
+
+    return (
+        int(result.group("major")),
+        int(result.group("minor")),
+        int(result.group("patch") or 0)
+    )
+
+
+class MariadbCapabilities(object):
+    """
+      probe the capabilities of a running mariadb server and cache the result
+      on the managed host.
+
+      the cache is invalidated when the server was restarted (the unix socket is
+      re-created at every start) or the server binary has been changed.
+    """
+    module = None
+
+    def __init__(self, module, cache_directory=None, socket=None):
+        """
+        """
+        self.module = module
+        self.cache_directory = cache_directory
+        self.socket = socket
+
+        self.cache_file = None
+
+        if self.cache_directory:
+            self.cache_file = os.path.join(self.cache_directory, CACHE_FILE_NAME)
+
+    def probe(self, cursor):
+        """
+          return the server capabilities.
+          a valid cache entry is returned without touching the database.
+        """
+        fingerprint = self.fingerprint()
+
+        cached = self.load(fingerprint)
+
+        if cached:
+            return cached
+
+        capabilities = self.query(cursor)
+
+        self.save(fingerprint, capabilities)
+
+        return capabilities
+
+    def query(self, cursor):
+        """
+          read all needed server variables with a single query
+        """
+        variables = {}
+
+        names = ", ".join([f"'{x}'" for x in PROBE_VARIABLES])
+
+        cursor.execute(f"SHOW GLOBAL VARIABLES WHERE Variable_name IN ({names})")
+
+        for row in cursor.fetchall():
+            if isinstance(row, dict):
+                variables[row.get("Variable_name").lower()] = row.get("Value")
+            else:
+                variables[row[0].lower()] = row[1]
+
+        version_full = variables.get("version", "")
+        major, minor, patch = version_tuple(version_full)
+
+        return dict(
+            version=f"{major}.{minor}.{patch}",
+            short_version=f"{major}.{minor}",
+            full_version=version_full,
+            version_comment=variables.get("version_comment", ""),
+            # REPLICA is available since 10.5.1
+            replica_term="REPLICA" if (major, minor, patch) >= (10, 5, 1) else "SLAVE",
+            # MariaDB GTID is available since 10.0.2
+            gtid=(major, minor, patch) >= (10, 0, 2),
+            galera=str(variables.get("wsrep_on", "OFF")).upper() == "ON",
+            tls=str(variables.get("have_ssl", "NO")).upper() == "YES",
+        )
+
+    def fingerprint(self):
+        """
+          identify the running server instance without asking the server.
+          returns None if no reliable fingerprint can be created.
+        """
+        if not self.socket or not os.path.exists(self.socket):
+            return None
+
+        socket_stat = os.stat(self.socket)
+
+        result = dict(
+            socket=dict(
+                path=self.socket,
+                inode=socket_stat.st_ino,
+                ctime=socket_stat.st_ctime,
+            )
+        )
+
+        binary = next((x for x in SERVER_BINARIES if os.path.isfile(os.path.realpath(x))), None)
+
+        if binary:
+            binary_stat = os.stat(os.path.realpath(binary))
+
+            result["binary"] = dict(
+                path=binary,
+                inode=binary_stat.st_ino,
+                size=binary_stat.st_size,
+                mtime=binary_stat.st_mtime,
+            )
+
+        return result
+
+    def load(self, fingerprint):
+        """
+        """
+        if not self.cache_file or not fingerprint or not os.path.isfile(self.cache_file):
+            return None
+
+        try:
+            with open(self.cache_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.module.log(msg=f"WARNING: can't read capabilities cache {self.cache_file}: {e}")
+            return None
+
+        if data.get("fingerprint") != fingerprint:
+            return None
+
+        return data.get("capabilities")
+
+    def save(self, fingerprint, capabilities):
+        """
+        """
+        if not self.cache_file or not fingerprint or not os.path.isdir(self.cache_directory):
+            return
+
+        data = dict(
+            fingerprint=fingerprint,
+            capabilities=capabilities,
+        )
+
+        try:
+            write_file_atomic(self.cache_file, json.dumps(data, indent=2, sort_keys=True), mode=0o0600)
+        except OSError as e:
+            self.module.log(msg=f"WARNING: can't write capabilities cache {self.cache_file}: {e}")
+
+    def invalidate(self):
+        """
+        """
+        if self.cache_file and os.path.isfile(self.cache_file):
+            os.remove(self.cache_file)
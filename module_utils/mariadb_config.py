@@ -0,0 +1,391 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+
+__metaclass__ = type
+
+# ---------------------------------------------------------------------------------------
+
+# option groups read by the server
+SERVER_GROUPS = [
+    "server",
+    "mysqld",
+    "mariadb",
+    "galera",
+]
+
+SECTION = re.compile(r"^\s*\[(?P<name>[^\]]+)\]")
+NUMBER = re.compile(r"^(?P<number>-?\d+(\.\d+)?)(?P<unit>[KMGTP])?$", re.IGNORECASE)
+
+SIZE_UNITS = dict(
+    K=1024,
+    M=1024 ** 2,
+    G=1024 ** 3,
+    T=1024 ** 4,
+    P=1024 ** 5,
+)
+
+# the server rounds these variables to a multiple of the block size
+ROUNDED_VARIABLES = dict(
+    query_cache_size=1024,
+    join_buffer_size=128,
+    key_buffer_size=4096,
+    max_binlog_size=4096,
+    max_relay_log_size=4096,
+)
+
+# the server shows the value of these variables masked, e.g. wsrep_sst_auth = ********
+MASKED_VALUE = re.compile(r"^\*+$")
+
+# variables with credentials, the value is never returned
+SECRET_VARIABLES = [
+    "wsrep_sst_auth",
+]
+
+TRUE_VALUES = ["on", "true", "yes", "1"]
+FALSE_VALUES = ["off", "false", "no", "0"]
+
+
+def read_option_file(path, groups=None):
+    """
+      read the options of the given groups from a my.cnf style file.
+      the last value of an option wins, like for the server.
+
+      returns {'option name': 'raw value' or None for flags}
+    """
+    if groups is None:
+        groups = SERVER_GROUPS
+
+    with open(path, "r") as f:
+        content = f.read()
+
+    return parse_options(content, groups)
+
+
+def parse_options(content, groups):
+    """
+    """
+    result = {}
+    current = None
+
+    for line in content.splitlines():
+        line = line.strip()
+
+        # comments and !include / !includedir directives
+        if not line or line[0] in "#;!":
+            continue
+
+        match = SECTION.match(line)
+
+        if match:
+            current = match.group("name").strip()
+            continue
+
+        if current not in groups:
+            continue
+
+        if "=" in line:
+            key, value = line.split("=", 1)
+            result[key.strip()] = unquote(strip_comment(value.strip()))
+        else:
+            result[line] = None
+
+    return result
+
+
+def server_variables(cursor):
+    """
+      all global variables of the running server with a single query.
+
+      {'name': {'value': '...', 'read_only': True | False | None (unknown)}}
+    """
+    result = {}
+
+    try:
+        cursor.execute(
+            "SELECT VARIABLE_NAME, GLOBAL_VALUE, READ_ONLY FROM information_schema.SYSTEM_VARIABLES"
+        )
+
+        for name, value, read_only in cursor.fetchall():
+            result[name.lower()] = dict(
+                value=value,
+                read_only=(read_only == "YES")
+            )
+
+        return result
+
+    except Exception:
+        # information_schema.SYSTEM_VARIABLES exists since 10.1
+        pass
+
+    cursor.execute("SHOW GLOBAL VARIABLES")
+
+    for name, value in cursor.fetchall():
+        result[name.lower()] = dict(
+            value=value,
+            read_only=None
+        )
+
+    return result
+
+
+def config_diff(options, variables):
+    """
+      compare the options of read_option_file() with server_variables().
+
+      returns (list of differing variables, list of options which are no variables).
+      masked variables can't be compared and are skipped, secret values are redacted.
+    """
+    desired = {}
+    unknown = []
+
+    for option, value in options.items():
+        name, value = normalize_option(option, value, variables)
+
+        if name not in variables:
+            unknown.append(option)
+            continue
+
+        desired[name] = (option, value)
+
+    result = []
+
+    for name, (option, value) in desired.items():
+        current = variables.get(name)
+
+        if MASKED_VALUE.match(str(current.get("value") or "")):
+            continue
+
+        if variable_equal(name, value, current.get("value"), variables):
+            continue
+
+        result.append(dict(
+            name=name,
+            option=option,
+            current=redact(name, current.get("value")),
+            desired=value,
+            read_only=current.get("read_only")
+        ))
+
+    return (result, unknown)
+
+
+def redact(name, value):
+    """
+    """
+    if value and (name in SECRET_VARIABLES or "password" in name):
+        return "********"
+
+    return value
+
+
+def variable_equal(name, desired, current, variables):
+    """
+      compare an option with the running server, like the server interprets it:
+        - paths without trailing slash, relative file names below the datadir
+          (e.g. log_bin_index = host-log-bin.index -> /var/lib/mysql/host-log-bin.index)
+        - sizes, which the server rounds to a block size (e.g. innodb_buffer_pool_size)
+    """
+    if values_equal(desired, current):
+        return True
+
+    if current and str(current).startswith("/") and desired and "," not in str(desired):
+        datadir = variables.get("datadir", {}).get("value")
+        return normalize_path(desired, datadir) == normalize_path(current, datadir)
+
+    block = rounding_block(name, variables)
+    desired_number = normalize_number(desired)
+    current_number = normalize_number(current)
+
+    if block and desired_number is not None and current_number is not None:
+        return abs(desired_number - current_number) < block
+
+    return False
+
+
+def normalize_path(value, datadir=None):
+    """
+    """
+    value = str(value).strip()
+
+    if datadir and not os.path.isabs(value):
+        value = os.path.join(str(datadir), value)
+
+    return os.path.normpath(value)
+
+
+def rounding_block(name, variables):
+    """
+    """
+    if name == "innodb_buffer_pool_size":
+        # rounded up to a multiple of innodb_buffer_pool_chunk_size * innodb_buffer_pool_instances
+        chunk_size = normalize_number(variables.get("innodb_buffer_pool_chunk_size", {}).get("value")) or 128 * 1024 * 1024
+        instances = normalize_number(variables.get("innodb_buffer_pool_instances", {}).get("value")) or 1
+
+        return chunk_size * instances
+
+    return ROUNDED_VARIABLES.get(name)
+
+
+def strip_comment(value):
+    """
+      remove a trailing '# comment' outside of quotes
+    """
+    if value[:1] in ("'", '"'):
+        return value
+
+    return value.split(" #", 1)[0].strip()
+
+
+def unquote(value):
+    """
+    """
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in ("'", '"'):
+        value = value[1:-1]
+        if value.find("\\") >= 0:
+            value = value.replace('\\"', '"').replace("\\\\", "\\")
+
+    return value
+
+
+def normalize_name(name):
+    """
+      'loose-innodb-buffer-pool-size' -> 'innodb_buffer_pool_size'
+    """
+    name = name.strip().lower().replace("-", "_")
+
+    if name.startswith("loose_"):
+        name = name[len("loose_"):]
+
+    return name
+
+
+def normalize_option(name, value, variables=None):
+    """
+      map a option of the option file to (system variable, value).
+
+      - flags without a value are enabled
+      - 'skip-<variable>' / 'disable-<variable>' disable the variable, unless
+        the option itself is a variable (e.g. skip_name_resolve)
+      - 'enable-<variable>' enables the variable
+      - 'log-bin[=basename]' enables binary logging (variable log_bin)
+    """
+    name = normalize_name(name)
+
+    if value is None:
+        value = "ON"
+
+    if name == "log_bin":
+        return (name, "OFF" if str(value).lower() in FALSE_VALUES else "ON")
+
+    if variables is not None and name not in variables:
+        for prefix, state in [("skip_", "OFF"), ("disable_", "OFF"), ("enable_", "ON")]:
+            if name.startswith(prefix) and name[len(prefix):] in variables:
+                return (name[len(prefix):], state)
+
+    return (name, value)
+
+
+def normalize_number(value):
+    """
+      sizes with K/M/G/T/P suffix in bytes, numbers without trailing zeros
+      ('8G' -> 8589934592, '10.000000' -> 10).
+      returns None for all other values.
+    """
+    match = NUMBER.match(str(value).strip())
+
+    if not match:
+        return None
+
+    number = match.group("number")
+    unit = SIZE_UNITS.get((match.group("unit") or "").upper(), 1)
+
+    # integers without float rounding (e.g. 18446744073709551615)
+    if "." not in number:
+        return int(number) * unit
+
+    number = float(number) * unit
+
+    return int(number) if number.is_integer() else number
+
+
+def normalize_value(value):
+    """
+      canonical string of an option value or a server variable,
+      numbers are normalized and booleans are ON / OFF.
+    """
+    if value is None:
+        return ""
+
+    value = str(value).strip()
+    number = normalize_number(value)
+
+    if number is not None:
+        value = str(number)
+
+    if value.lower() in TRUE_VALUES:
+        return "ON"
+
+    if value.lower() in FALSE_VALUES:
+        return "OFF"
+
+    return value
+
+
+def values_equal(desired, current):
+    """
+    """
+    desired = normalize_value(desired)
+    current = normalize_value(current)
+
+    if desired == current:
+        return True
+
+    # enums and sets (e.g. sql_mode) are case insensitive, sets are unordered
+    desired = [x.strip() for x in desired.upper().split(",") if x.strip()]
+    current = [x.strip() for x in current.upper().split(",") if x.strip()]
+
+    return sorted(desired) == sorted(current)
+
+
+def sql_value(value):
+    """
+      the option value as parameter for 'SET GLOBAL'
+    """
+    if value is None:
+        return "ON"
+
+    number = normalize_number(value)
+
+    if number is not None:
+        return number
+
+    value = str(value).strip()
+
+    if value.lower() in TRUE_VALUES:
+        return "ON"
+
+    if value.lower() in FALSE_VALUES:
+        return "OFF"
+
+    return value
+
+
+def format_size(value, minimum=1024 * 1024):
+    """
+      bytes as option value, rounded up to full megabytes
+      (134217728 -> '128M', 8589934592 -> '8G')
+    """
+    mb = -(-max(int(value), minimum) // (1024 * 1024))
+
+    if mb % 1024 == 0:
+        return f"{mb // 1024}G"
+
+    return f"{mb}M"
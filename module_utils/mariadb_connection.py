@@ -0,0 +1,546 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import time
+import select
+import socket
+import struct
+import hashlib
+import tempfile
+import warnings
+
+from ansible.module_utils._text import to_native
+from ansible.module_utils.mysql import mysql_driver, mysql_driver_fail_msg
+
+__metaclass__ = type
+
+# ---------------------------------------------------------------------------------------
+
+
+def broker_argument_spec():
+    """
+      arguments to enable the connection broker in a module
+    """
+    return dict(
+        use_broker=dict(
+            required=False,
+            type='bool',
+            default=False
+        ),
+        broker_ttl=dict(
+            required=False,
+            type='int',
+            default=300
+        ),
+    )
+
+
+def mariadb_connect(
+        module,
+        login_user=None,
+        login_password=None,
+        login_unix_socket=None,
+        login_host=None,
+        login_port=None,
+        config_file=None,
+        connect_timeout=None,
+        dict_cursor=False,
+        use_broker=False,
+        broker_ttl=300):
+    """
+        open a database connection, optional through the local connection broker.
+
+        return:
+            cursor
+            conn
+            error
+            message
+    """
+    config = {}
+
+    if config_file and os.path.exists(config_file):
+        config['read_default_file'] = config_file
+
+    # If login_user or login_password are given, they should override the
+    # config file
+    if login_user is not None:
+        config['user'] = login_user
+
+    if login_password is not None:
+        config['passwd'] = login_password
+
+    if login_unix_socket is not None and os.path.exists(login_unix_socket):
+        config['unix_socket'] = login_unix_socket
+    elif login_host is not None:
+        config['host'] = login_host
+        if login_port is not None:
+            config['port'] = int(login_port)
+
+    if connect_timeout is not None:
+        config['connect_timeout'] = int(connect_timeout)
+
+    # self.module.log(msg=f"config : {config}")
+
+    if mysql_driver is None:
+        module.fail_json(msg=mysql_driver_fail_msg)
+
+    if use_broker:
+        try:
+            db_connection = BrokerConnection(module, config, ttl=broker_ttl)
+
+            return (db_connection.cursor(dict_cursor), db_connection, False, "successful connected through broker")
+
+        except Exception as e:
+            # the broker is only an optimization, a direct connection still works
+            module.log(msg=f"WARNING: connection broker not usable: {to_native(e)}")
+
+    try:
+        db_connection = mysql_driver.connect(**config)
+
+    except Exception as e:
+        message = "unable to connect to database. "
+        message += "check login_host, login_user and login_password are correct "
+        message += f"or {config_file} has the credentials. "
+        message += f"Exception message: {to_native(e)}"
+
+        module.log(msg=message)
+
+        return (None, None, True, message)
+
+    if dict_cursor:
+        cursor = db_connection.cursor(mysql_driver.cursors.DictCursor)
+    else:
+        cursor = db_connection.cursor()
+
+    return (cursor, db_connection, False, "successful connected")
+
+
+def server_stopped(login_unix_socket, pid_file=None):
+    """
+      nothing accepts connections on the socket and the process of the pid file (if any) doesn't run.
+      without a socket (tcp connection) the server state is unknown.
+    """
+    if not login_unix_socket:
+        return False
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.connect(login_unix_socket)
+        return False
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+    if pid_file and os.path.isfile(pid_file):
+        try:
+            with open(pid_file) as f:
+                os.kill(int(f.read().strip()), 0)
+            return False
+        except (OSError, ValueError):
+            pass
+
+    return True
+
+
+# ---------------------------------------------------------------------------------------
+# connection broker
+#
+# The broker is a small daemon which holds one database connection and executes the
+# statements of later module invocations over its unix socket.
+# It is bound to the connection parameters, only accessible by the same uid and
+# terminates itself after 'ttl' seconds without a client.
+#
+# protocol: one json document per line
+#   request : {"op": "execute", "query": "...", "args": [...], "dict": true, "warnings": "error"}
+#             {"op": "hello"} | {"op": "commit"} | {"op": "rollback"}
+#   response: {"rows": [...], "rowcount": 0, "lastrowid": 0}
+#             {"error": {"type": "OperationalError", "args": [2006, "..."]}}
+# ---------------------------------------------------------------------------------------
+
+
+def _json_default(value):
+    """
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+
+    return str(value)
+
+
+def _broker_directory():
+    """
+    """
+    for directory in ["/run", tempfile.gettempdir()]:
+        if os.path.isdir(directory) and os.access(directory, os.W_OK):
+            return directory
+
+    return tempfile.gettempdir()
+
+
+def broker_socket_path(config):
+    """
+      every set of connection parameters gets its own broker
+    """
+    checksum = hashlib.sha256(json.dumps(config, sort_keys=True).encode("utf-8")).hexdigest()
+
+    return os.path.join(_broker_directory(), f".ansible-mariadb-broker-{os.getuid()}-{checksum[:16]}.sock")
+
+
+class BrokerError(Exception):
+    pass
+
+
+class BrokerCursor(object):
+    """
+      cursor compatible subset for connections through the broker
+    """
+
+    def __init__(self, connection, dict_cursor=False):
+        self.connection = connection
+        self.dict_cursor = dict_cursor
+        self.rows = []
+        self.rowcount = -1
+        self.lastrowid = None
+
+    def execute(self, query, args=None):
+        """
+        """
+        if isinstance(args, tuple):
+            args = list(args)
+
+        response = self.connection.request(
+            dict(
+                op="execute",
+                query=query,
+                args=args,
+                dict=self.dict_cursor,
+                warnings=self.connection.warnings_mode(),
+            )
+        )
+
+        rows = response.get("rows", [])
+
+        if not self.dict_cursor:
+            rows = [tuple(x) for x in rows]
+
+        self.rows = rows
+        self.rowcount = response.get("rowcount", -1)
+        self.lastrowid = response.get("lastrowid")
+
+        return self.rowcount
+
+    def fetchone(self):
+        if not self.rows:
+            return None
+        return self.rows.pop(0)
+
+    def fetchall(self):
+        rows = self.rows
+        self.rows = []
+        return tuple(rows)
+
+    def close(self):
+        self.rows = []
+
+
+class BrokerConnection(object):
+    """
+      client side of the connection broker
+    """
+
+    def __init__(self, module, config, ttl=300):
+        """
+        """
+        self.module = module
+        self.config = config
+        self.ttl = ttl
+        self.socket_path = broker_socket_path(config)
+        self.sock = None
+        self.reader = None
+
+        if not self._connect():
+            self._spawn()
+
+            for _ in range(50):
+                if self._connect():
+                    break
+                time.sleep(0.1)
+
+        if not self.sock:
+            raise BrokerError(f"can't connect to broker {self.socket_path}")
+
+        self.request(dict(op="hello"))
+
+    def cursor(self, dict_cursor=False):
+        return BrokerCursor(self, dict_cursor)
+
+    def commit(self):
+        self.request(dict(op="commit"))
+
+    def rollback(self):
+        self.request(dict(op="rollback"))
+
+    def close(self):
+        """
+          only the client socket is closed, the broker keeps its connection
+        """
+        if self.sock:
+            try:
+                self.reader.close()
+                self.sock.close()
+            except OSError:
+                pass
+
+        self.sock = None
+
+    def warnings_mode(self):
+        """
+          forward the active warning filter of the module (e.g. 'error' for mysql_driver.Warning)
+        """
+        for action, message, category, module, lineno in warnings.filters:
+            if category is not None and issubclass(mysql_driver.Warning, category):
+                return action
+
+        return "default"
+
+    def request(self, data):
+        """
+        """
+        self.sock.sendall(json.dumps(data, default=_json_default).encode("utf-8") + b"\n")
+
+        line = self.reader.readline()
+
+        if not line:
+            self.close()
+            raise BrokerError("connection broker closed the connection")
+
+        response = json.loads(line.decode("utf-8"))
+
+        error = response.get("error")
+
+        if error:
+            exception = getattr(mysql_driver, error.get("type", "Error"), None)
+
+            if not (isinstance(exception, type) and issubclass(exception, Exception)):
+                exception = mysql_driver.Error
+
+            raise exception(*error.get("args", []))
+
+        return response
+
+    def _connect(self):
+        """
+        """
+        if not os.path.exists(self.socket_path):
+            return False
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            return False
+
+        self.sock = sock
+        self.reader = sock.makefile("rb")
+
+        return True
+
+    def _spawn(self):
+        """
+          start the broker as a detached daemon (double fork)
+        """
+        # a dead broker may have left its socket
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        pid = os.fork()
+
+        if pid > 0:
+            os.waitpid(pid, 0)
+            return
+
+        try:
+            os.setsid()
+
+            if os.fork() > 0:
+                os._exit(0)
+
+            devnull = os.open(os.devnull, os.O_RDWR)
+            for fd in (0, 1, 2):
+                os.dup2(devnull, fd)
+
+            # don't hold any pipe of the ansible connection open
+            os.closerange(3, 1024)
+
+            ConnectionBroker(self.config, self.socket_path, self.ttl).serve()
+        finally:
+            os._exit(0)
+
+
+class ConnectionBroker(object):
+    """
+      server side of the connection broker
+    """
+
+    def __init__(self, config, socket_path, ttl):
+        self.config = config
+        self.socket_path = socket_path
+        self.ttl = ttl
+        self.connection = None
+
+    def serve(self):
+        """
+        """
+        self.connection = mysql_driver.connect(**self.config)
+
+        old_umask = os.umask(0o177)
+
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(self.socket_path)
+        server.listen(8)
+
+        os.umask(old_umask)
+
+        try:
+            while True:
+                readable, _, _ = select.select([server], [], [], self.ttl)
+
+                # idle timeout reached
+                if not readable:
+                    break
+
+                client, _ = server.accept()
+                client.settimeout(self.ttl)
+
+                try:
+                    if not self._allowed(client):
+                        continue
+
+                    if not self._handle(client):
+                        break
+                finally:
+                    client.close()
+        finally:
+            server.close()
+
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+            try:
+                self.connection.close()
+            except Exception:
+                pass
+
+    def _allowed(self, client):
+        """
+          only clients with the same uid are served
+        """
+        if not hasattr(socket, "SO_PEERCRED"):
+            return True
+
+        credentials = client.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        pid, uid, gid = struct.unpack("3i", credentials)
+
+        return uid == os.getuid()
+
+    def _handle(self, client):
+        """
+          serve one client session.
+          returns False if the database connection is lost and the broker should exit.
+        """
+        reader = client.makefile("rb")
+        alive = True
+
+        try:
+            for line in reader:
+                request = json.loads(line.decode("utf-8"))
+                response, alive = self._dispatch(request)
+
+                client.sendall(json.dumps(response, default=_json_default).encode("utf-8") + b"\n")
+
+                if not alive:
+                    break
+        except (OSError, ValueError):
+            pass
+        finally:
+            reader.close()
+
+        if alive:
+            # never leak an open transaction into the next session
+            try:
+                self.connection.rollback()
+            except Exception:
+                alive = False
+
+        return alive
+
+    def _dispatch(self, request):
+        """
+        """
+        op = request.get("op")
+
+        try:
+            if op == "hello":
+                self.connection.ping()
+                return dict(ok=True), True
+
+            if op == "commit":
+                self.connection.commit()
+                return dict(ok=True), True
+
+            if op == "rollback":
+                self.connection.rollback()
+                return dict(ok=True), True
+
+            if op == "execute":
+                return self._execute(request), True
+
+            return dict(error=dict(type="ProgrammingError", args=[f"unknown operation {op}"])), True
+
+        except mysql_driver.OperationalError as e:
+            # lost connection or server restart: let the next client spawn a new broker
+            return self._error(e), False
+
+        except Exception as e:
+            return self._error(e), True
+
+    def _error(self, exception):
+        """
+        """
+        args = [x if isinstance(x, (int, float)) else to_native(x) for x in exception.args]
+
+        return dict(error=dict(type=type(exception).__name__, args=args))
+
+    def _execute(self, request):
+        """
+        """
+        if request.get("dict"):
+            cursor = self.connection.cursor(mysql_driver.cursors.DictCursor)
+        else:
+            cursor = self.connection.cursor()
+
+        try:
+            with warnings.catch_warnings():
+                warnings.simplefilter(request.get("warnings", "default"), category=mysql_driver.Warning)
+                cursor.execute(request.get("query"), request.get("args"))
+
+            rows = cursor.fetchall() if cursor.description else []
+
+            return dict(
+                rows=[x if isinstance(x, dict) else list(x) for x in rows],
+                rowcount=cursor.rowcount,
+                lastrowid=cursor.lastrowid,
+            )
+        finally:
+            cursor.close()
@@ -0,0 +1,529 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import json
+import stat
+import time
+import fcntl
+import hashlib
+import tempfile
+import threading
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from ansible.module_utils.mariadb_file import write_file_atomic
+
+__metaclass__ = type
+
+# ---------------------------------------------------------------------------------------
+
+# linux/fs.h: _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def reflink(source_fd, destination_fd):
+    """
+      clone the extents of source into destination (btrfs, xfs with reflink=1, ...).
+      returns False if the filesystem doesn't support it.
+    """
+    try:
+        fcntl.ioctl(destination_fd, FICLONE, source_fd)
+        return True
+    except OSError:
+        return False
+
+
+def reflink_supported(source_directory, destination_directory):
+    """
+      probe FICLONE between two directories with temporary files
+    """
+    source_fd, source_file = tempfile.mkstemp(prefix=".reflink.", dir=source_directory)
+
+    try:
+        os.write(source_fd, b"reflink")
+        os.fsync(source_fd)
+
+        destination_fd, destination_file = tempfile.mkstemp(prefix=".reflink.", dir=destination_directory)
+
+        try:
+            return reflink(source_fd, destination_fd)
+        finally:
+            os.close(destination_fd)
+            os.remove(destination_file)
+    finally:
+        os.close(source_fd)
+        os.remove(source_file)
+
+
+def same_filesystem(source, destination_directory):
+    """
+    """
+    return os.stat(source).st_dev == os.stat(destination_directory).st_dev
+
+
+def copy_data(source_fd, destination_fd, size):
+    """
+      copy the content inside the kernel: copy_file_range, sendfile or read/write as fallback
+    """
+    offset = 0
+
+    if hasattr(os, "copy_file_range"):
+        try:
+            while offset < size:
+                copied = os.copy_file_range(source_fd, destination_fd, min(COPY_CHUNK_SIZE, size - offset))
+                if copied == 0:
+                    break
+                offset += copied
+            return offset
+        except OSError:
+            # e.g. EXDEV on older kernels, continue at the current position
+            pass
+
+    try:
+        while offset < size:
+            copied = os.sendfile(destination_fd, source_fd, offset, min(COPY_CHUNK_SIZE, size - offset))
+            if copied == 0:
+                break
+            offset += copied
+        os.lseek(destination_fd, offset, os.SEEK_SET)
+        return offset
+    except OSError:
+        pass
+
+    os.lseek(source_fd, offset, os.SEEK_SET)
+    os.lseek(destination_fd, offset, os.SEEK_SET)
+
+    while True:
+        chunk = os.read(source_fd, 1024 * 1024)
+        if not chunk:
+            break
+        os.write(destination_fd, chunk)
+        offset += len(chunk)
+
+    return offset
+
+
+def copy_file(source, destination, source_stat, uid=None, gid=None, use_reflink=True):
+    """
+      copy one file with mode, ownership and mtime.
+      returns the method which was used ('reflink' or 'copy').
+    """
+    source_fd = os.open(source, os.O_RDONLY)
+
+    try:
+        destination_fd = os.open(destination, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o0600)
+
+        try:
+            # ownership is set before the content is written, the file is never readable by others
+            if uid is not None or gid is not None:
+                os.fchown(destination_fd, -1 if uid is None else uid, -1 if gid is None else gid)
+
+            if use_reflink and reflink(source_fd, destination_fd):
+                method = "reflink"
+            else:
+                copy_data(source_fd, destination_fd, source_stat.st_size)
+                method = "copy"
+
+            os.fchmod(destination_fd, stat.S_IMODE(source_stat.st_mode))
+            os.utime(destination_fd, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+        finally:
+            os.close(destination_fd)
+    finally:
+        os.close(source_fd)
+
+    return method
+
+
+def scan_tree(source):
+    """
+      walk the tree only once.
+      returns (directories, files, symlinks) as lists of (relative path, stat)
+    """
+    directories = []
+    files = []
+    symlinks = []
+
+    pending = [""]
+
+    while pending:
+        relative = pending.pop()
+
+        with os.scandir(os.path.join(source, relative)) as entries:
+            for entry in entries:
+                path = os.path.join(relative, entry.name)
+                entry_stat = entry.stat(follow_symlinks=False)
+
+                if entry.is_symlink():
+                    symlinks.append((path, entry_stat))
+                elif entry.is_dir(follow_symlinks=False):
+                    directories.append((path, entry_stat))
+                    pending.append(path)
+                elif entry.is_file(follow_symlinks=False):
+                    files.append((path, entry_stat))
+
+    directories.sort()
+
+    return directories, files, symlinks
+
+
+class CopyProgress(object):
+    """
+      thread safe progress, persisted in a status file
+    """
+
+    def __init__(self, status_file, files_total, bytes_total, interval=1.0):
+        self.status_file = status_file
+        self.files_total = files_total
+        self.bytes_total = bytes_total
+        self.interval = interval
+
+        self.files_copied = 0
+        self.bytes_copied = 0
+        self.reflinked = 0
+        self.resumed = 0
+        self.bytes_resumed = 0
+        self.started = time.time()
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def add(self, size, method):
+        """
+        """
+        with self.lock:
+            self.files_copied += 1
+            self.bytes_copied += size
+            if method == "reflink":
+                self.reflinked += 1
+            if method == "resumed":
+                self.resumed += 1
+                self.bytes_resumed += size
+
+            if time.time() - self.written >= self.interval:
+                self.save("running")
+
+    def status(self, state):
+        """
+        """
+        elapsed = max(time.time() - self.started, 0.001)
+        # files of an earlier run don't count for the transfer rate
+        rate = (self.bytes_copied - self.bytes_resumed) / elapsed
+        eta = None
+
+        if rate > 0:
+            eta = int((self.bytes_total - self.bytes_copied) / rate)
+
+        return dict(
+            state=state,
+            files_total=self.files_total,
+            files_copied=self.files_copied,
+            files_reflinked=self.reflinked,
+            files_resumed=self.resumed,
+            bytes_total=self.bytes_total,
+            bytes_copied=self.bytes_copied,
+            bytes_per_second=int(rate),
+            elapsed_seconds=int(elapsed),
+            eta_seconds=eta,
+        )
+
+    def save(self, state):
+        """
+        """
+        self.written = time.time()
+
+        if not self.status_file:
+            return
+
+        try:
+            write_file_atomic(self.status_file, json.dumps(self.status(state), indent=2, sort_keys=True), mode=0o0644)
+        except OSError:
+            pass
+
+
+class CopyManifest(object):
+    """
+      per file state of a copy (size, mtime and after verification the checksum).
+      a copy which was interrupted continues with the files which are not
+      in the manifest or have been changed in the meantime.
+    """
+
+    def __init__(self, manifest_file, source, interval=1.0):
+        self.manifest_file = manifest_file
+        self.source = source
+        self.interval = interval
+        self.state = "running"
+        self.files = {}
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def load(self):
+        """
+          returns False if there is no usable manifest for this source
+        """
+        if not self.manifest_file or not os.path.isfile(self.manifest_file):
+            return False
+
+        try:
+            with open(self.manifest_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+
+        if data.get("source") != self.source:
+            return False
+
+        self.state = data.get("state", "running")
+        self.files = data.get("files", {})
+
+        return True
+
+    def completed(self, path, source_stat, destination):
+        """
+          the file was copied completely by a previous run and is unchanged since
+        """
+        entry = self.files.get(path)
+
+        if not entry:
+            return False
+
+        if entry.get("size") != source_stat.st_size or entry.get("mtime") != source_stat.st_mtime_ns:
+            return False
+
+        try:
+            return os.stat(destination).st_size == source_stat.st_size
+        except OSError:
+            return False
+
+    def add(self, path, source_stat, checksum=None):
+        """
+        """
+        with self.lock:
+            self.files[path] = dict(
+                size=source_stat.st_size,
+                mtime=source_stat.st_mtime_ns,
+                checksum=checksum,
+            )
+
+            if time.time() - self.written >= self.interval:
+                self._save()
+
+    def save(self, state=None):
+        """
+        """
+        with self.lock:
+            if state:
+                self.state = state
+            self._save()
+
+    def _save(self):
+        """
+        """
+        self.written = time.time()
+
+        if not self.manifest_file:
+            return
+
+        data = dict(
+            source=self.source,
+            state=self.state,
+            files=self.files,
+        )
+
+        write_file_atomic(self.manifest_file, json.dumps(data, sort_keys=True), mode=0o0600)
+
+
+def file_checksum(filename, chunk_size=1024 * 1024):
+    """
+    """
+    checksum = hashlib.sha256()
+
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            checksum.update(chunk)
+
+    return checksum.hexdigest()
+
+
+class TreeCopy(object):
+    """
+      copy a directory tree (e.g. a mariadb datadir) with a thread pool.
+      the largest files are copied first to keep all workers busy.
+
+      with a manifest file an interrupted copy is resumed and the copy
+      can be verified before the source is touched.
+    """
+
+    def __init__(self, source, destination, uid=None, gid=None, threads=4, use_reflink=True, status_file=None, manifest_file=None):
+        self.source = source
+        self.destination = destination
+        self.uid = uid
+        self.gid = gid
+        self.threads = max(int(threads), 1)
+        self.use_reflink = use_reflink
+        self.status_file = status_file
+        self.manifest = CopyManifest(manifest_file, source)
+
+        self.files = []
+
+    def run(self):
+        """
+          returns the final progress status
+        """
+        directories, files, symlinks = scan_tree(self.source)
+
+        files.sort(key=lambda x: x[1].st_size, reverse=True)
+        self.files = files
+
+        self.manifest.load()
+        self.manifest.save("running")
+
+        progress = CopyProgress(self.status_file, len(files), sum(x[1].st_size for x in files))
+        progress.save("running")
+
+        source_stat = os.stat(self.source)
+
+        self._make_directory("", source_stat)
+
+        for path, entry_stat in directories:
+            self._make_directory(path, entry_stat)
+
+        for path, entry_stat in symlinks:
+            destination = os.path.join(self.destination, path)
+            if os.path.lexists(destination):
+                os.remove(destination)
+            os.symlink(os.readlink(os.path.join(self.source, path)), destination)
+            os.lchown(destination, self._uid(), self._gid())
+
+        pending = []
+
+        for path, entry_stat in files:
+            if self.manifest.completed(path, entry_stat, os.path.join(self.destination, path)):
+                progress.add(entry_stat.st_size, "resumed")
+            else:
+                pending.append((path, entry_stat))
+
+        try:
+            self._parallel(pending, self._copy, progress)
+        except Exception:
+            progress.save("failed")
+            self.manifest.save("failed")
+            raise
+
+        # directory times last, creating the entries changed them
+        for path, entry_stat in reversed([("", source_stat)] + directories):
+            os.utime(os.path.join(self.destination, path), ns=(entry_stat.st_atime_ns, entry_stat.st_mtime_ns))
+
+        progress.save("done")
+        self.manifest.save("copied")
+
+        return progress.status("done")
+
+    def verify(self, checksum=False):
+        """
+          compare every copied file with its source (size and mtime, optional
+          the sha256 checksum of both files, in parallel).
+          returns a list of differences.
+        """
+        differences = []
+
+        def verify_file(path, source_stat):
+            destination = os.path.join(self.destination, path)
+
+            try:
+                destination_stat = os.stat(destination)
+            except OSError as e:
+                return f"{path}: {e.strerror}"
+
+            if destination_stat.st_size != source_stat.st_size:
+                return f"{path}: size {destination_stat.st_size} != {source_stat.st_size}"
+
+            if destination_stat.st_mtime_ns != source_stat.st_mtime_ns:
+                return f"{path}: modification time differs"
+
+            if checksum:
+                source_checksum = file_checksum(os.path.join(self.source, path))
+
+                if file_checksum(destination) != source_checksum:
+                    return f"{path}: checksum differs"
+
+                self.manifest.add(path, source_stat, source_checksum)
+
+            return None
+
+        for path, entry_stat in self.files:
+            # the source must not have changed since the copy
+            if os.stat(os.path.join(self.source, path)).st_mtime_ns != entry_stat.st_mtime_ns:
+                differences.append(f"{path}: source changed during the copy")
+
+        if checksum:
+            self._parallel(self.files, verify_file, None, differences)
+        else:
+            for path, entry_stat in self.files:
+                result = verify_file(path, entry_stat)
+                if result:
+                    differences.append(result)
+
+        self.manifest.save("verified" if not differences else "failed")
+
+        return differences
+
+    def _copy(self, path, entry_stat):
+        """
+        """
+        method = copy_file(
+            os.path.join(self.source, path),
+            os.path.join(self.destination, path),
+            entry_stat,
+            self.uid,
+            self.gid,
+            self.use_reflink
+        )
+
+        self.manifest.add(path, entry_stat)
+
+        return method
+
+    def _parallel(self, files, function, progress=None, results=None):
+        """
+          run function(path, stat) for all files in the thread pool.
+          after the first exception the pending files are cancelled.
+        """
+        with ThreadPoolExecutor(max_workers=self.threads) as executor:
+            futures = {executor.submit(function, path, entry_stat): entry_stat for path, entry_stat in files}
+
+            try:
+                for future in as_completed(futures):
+                    result = future.result()
+
+                    if progress is not None:
+                        progress.add(futures[future].st_size, result)
+                    elif results is not None and result:
+                        results.append(result)
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def _make_directory(self, path, entry_stat):
+        """
+        """
+        destination = os.path.join(self.destination, path)
+
+        # missing parents of the destination are created
+        os.makedirs(destination, 0o0700, exist_ok=True)
+
+        os.chown(destination, self._uid(), self._gid())
+        os.chmod(destination, stat.S_IMODE(entry_stat.st_mode))
+
+    def _uid(self):
+        return -1 if self.uid is None else self.uid
+
+    def _gid(self):
+        return -1 if self.gid is None else self.gid
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+# -*- coding: utf-8 -*-
+
+# (c) 2024, Bodo Schulz <bodo@boone-schulz.de>
+# Apache (see LICENSE or https://opensource.org/licenses/Apache-2.0)
+
+from __future__ import absolute_import, division, print_function
+
+import os
+import re
+import tempfile
+
+__metaclass__ = type
+
+# ---------------------------------------------------------------------------------------
+
+SECTION = re.compile(r"^\s*\[(?P<name>[^\]]+)\]")
+OPTION = re.compile(r"^(?P<indent>\s*)(?P<key>[A-Za-z0-9_.-]+)\s*(=|$)")
+
+
+def write_file_atomic(path, content, mode=0o0600, uid=None, gid=None):
+    """
+      write content to a temporary file in the same directory and rename it.
+      readers always see either the old or the new file.
+
+      returns False if the file already has the same content.
+    """
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+
+    try:
+        with open(path, "rb") as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+
+    directory = os.path.dirname(os.path.abspath(path))
+
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", dir=directory)
+
+    try:
+        os.fchmod(fd, mode)
+
+        if uid is not None or gid is not None:
+            os.fchown(fd, -1 if uid is None else uid, -1 if gid is None else gid)
+
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.rename(tmp_file, path)
+
+    except Exception:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+    return True
+
+
+def copy_file_atomic(source, destination, mode=0o0600, uid=None, gid=None, chunk_size=64 * 1024):
+    """
+      copy source to a temporary file next to the destination, set mode and
+      ownership on the open file and rename it into place.
+    """
+    directory = os.path.dirname(os.path.abspath(destination))
+
+    fd, tmp_file = tempfile.mkstemp(prefix=f".{os.path.basename(destination)}.", dir=directory)
+
+    try:
+        os.fchmod(fd, mode)
+
+        if uid is not None or gid is not None:
+            os.fchown(fd, -1 if uid is None else uid, -1 if gid is None else gid)
+
+        with os.fdopen(fd, "wb") as dst, open(source, "rb") as src:
+            for chunk in iter(lambda: src.read(chunk_size), b""):
+                dst.write(chunk)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+        os.rename(tmp_file, destination)
+
+    except Exception:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
+def ensure_ownership(path, uid=None, gid=None, mode=None):
+    """
+      chown / chmod only if the current values differ.
+      returns True if something was changed.
+    """
+    st = os.lstat(path)
+    changed = False
+
+    if (uid is not None and st.st_uid != uid) or (gid is not None and st.st_gid != gid):
+        os.lchown(path, -1 if uid is None else uid, -1 if gid is None else gid)
+        changed = True
+
+    if mode is not None and (st.st_mode & 0o7777) != mode:
+        os.chmod(path, mode)
+        changed = True
+
+    return changed
+
+
+def ini_value(value):
+    """
+      quote option values which the option file parser would otherwise cut or change
+    """
+    value = str(value)
+
+    if value and not re.search(r"[\s#;'\"\\]", value):
+        return value
+
+    return '"{}"'.format(value.replace("\\", "\\\\").replace('"', '\\"'))
+
+
+def update_ini(content, section, options):
+    """
+      set options of one section in an ini style file (e.g. my.cnf).
+
+      comments, order and formatting of all other lines are kept,
+      existing options are replaced in place, missing options are appended
+      to the section and a missing section is appended to the file.
+    """
+    lines = content.splitlines(True) if content else []
+
+    if lines and not lines[-1].endswith("\n"):
+        lines[-1] += "\n"
+
+    pending = dict(options)
+    result = []
+    current = None
+    section_end = None
+
+    for line in lines:
+        match = SECTION.match(line)
+
+        if match:
+            if current == section:
+                section_end = len(result)
+            current = match.group("name").strip()
+            result.append(line)
+            continue
+
+        if current == section:
+            match = OPTION.match(line)
+            key = match.group("key") if match else None
+
+            if key in pending:
+                value = ini_value(pending.pop(key))
+
+                # keep the line untouched if it already has the value
+                if line.split("=", 1)[-1].strip() != value or "=" not in line:
+                    line = f"{match.group('indent')}{key} = {value}\n"
+
+                result.append(line)
+                continue
+
+            if key in options:
+                # duplicate option, the first one wins
+                continue
+
+        result.append(line)
+
+    if current == section:
+        section_end = len(result)
+
+    if pending:
+        new_lines = [f"{key} = {ini_value(value)}\n" for key, value in pending.items()]
+
+        if section_end is None:
+            if result and result[-1].strip():
+                result.append("\n")
+            result.append(f"[{section}]\n")
+            result += new_lines
+        else:
+            # behind the last option of the section, not behind trailing blank lines
+            while section_end > 0 and not result[section_end - 1].strip():
+                section_end -= 1
+            result[section_end:section_end] = new_lines
+
+    return "".join(result)